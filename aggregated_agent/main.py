@@ -10,17 +10,22 @@ import random
 from keras.models import Sequential, load_model, Model
 from keras.layers import Dense, Activation, Flatten, Concatenate, Input
 from keras.optimizers import Adam
-from collections import deque
-import glob
-import copy
+from core.replay import ReplayMemory
+from core.bellman import bellman_targets
+from core.checkpoint import Checkpointer
+from core import tensor
+from core.label import PriceLabeler
 
 
 class DDQNAgent:
     def __init__(self, agent_type, state_size, action_size):
         # load models
         self.agent_type = agent_type
+        self.checkpoint_path = './networks/' + self.agent_type + '_rl.h5'
         self.model = self.load_model()
         self.target_model = self.load_model()
+        # weights are written every 1000 steps, every 10 minutes and at the end of each episode
+        self.checkpoint = Checkpointer(self.model, self.checkpoint_path, every_steps=1000, every_secs=600)
 
         self.epsilon = 1.0
         self.epsilon_min = 0.001
@@ -30,27 +35,28 @@ class DDQNAgent:
         self.action_size = action_size
         self.train_start = 33
         self.target_update_interval = 10000
-        self.memory = deque(maxlen=100000)
+        self.memory = ReplayMemory(100000)
         self.discount_factor = 0.999
+        # the online model picks the next action and the target model values it
+        self.double_dqn = True
 
     def load_model(self):
-        networks = glob.glob('./networks/*.h5')
-        if './networks/' + self.agent_type + '_rl' not in networks:
-            # model = load_model('./networks/' + self.agent_type + '.h5')
-            # model.layers.pop()
-            # output_layer = Dense(2, activation='linear', name='rl_output')(model.layers[-1].output)
-            # model = Model(inputs=model.input, outputs=output_layer)
-
-            trained_model = load_model('./networks/' + self.agent_type + '.h5')
-            for layer in trained_model.layers:
-                layer.trainable = False
-            rl_model = load_model('./networks/' + self.agent_type + '.h5')
-            concat_layer = Concatenate(name='concat2')([trained_model(rl_model.input), rl_model.layers[-1].output])
-            output_layer = Dense(2, activation='linear', name='q_value_output')(concat_layer)
-            model = Model(inputs=rl_model.input, outputs=output_layer)
-
-        else:
-            model = load_model('./networks/' + self.agent_type + '_rl.h5')
+        # the checkpoint holds the weights only, the network is built from the supervised model
+        # model = load_model('./networks/' + self.agent_type + '.h5')
+        # model.layers.pop()
+        # output_layer = Dense(2, activation='linear', name='rl_output')(model.layers[-1].output)
+        # model = Model(inputs=model.input, outputs=output_layer)
+
+        trained_model = load_model('./networks/' + self.agent_type + '.h5')
+        for layer in trained_model.layers:
+            layer.trainable = False
+        rl_model = load_model('./networks/' + self.agent_type + '.h5')
+        concat_layer = Concatenate(name='concat2')([trained_model(rl_model.input), rl_model.layers[-1].output])
+        output_layer = Dense(2, activation='linear', name='q_value_output')(concat_layer)
+        model = Model(inputs=rl_model.input, outputs=output_layer)
+
+        if os.path.exists(self.checkpoint_path):
+            model.load_weights(self.checkpoint_path)
 
         # for layer in model.layers[:-1]:
         #     layer.trainable = False
@@ -85,8 +91,23 @@ class DDQNAgent:
             q_value = self.model.predict([np.array([state[0]]), np.array([state[1]]), np.array([state[2]])])
             return np.argmax(q_value[0])
 
+    def get_actions(self, states):
+        """
+        actions of several states with one forward pass for the states not explored randomly
+        :param states: list of states, one per environment
+        :return: list of actions
+        """
+        actions = [random.randrange(self.action_size) if np.random.random() <= self.epsilon else None for _ in states]
+        greedy = [i for i, action in enumerate(actions) if action is None]
+        if greedy:
+            q_value = self.model.predict([np.array([states[i][h] for i in greedy]) for h in range(3)],
+                                         batch_size=len(greedy))
+            for i, q in zip(greedy, q_value):
+                actions[i] = np.argmax(q)
+        return actions
+
     def append_sample(self, state, action, reward, next_state, done):
-        self.memory.append((state, action, reward, next_state, done))
+        self.memory.append(state, action, reward, next_state, done)
 
     def train_model(self):
         if len(self.memory) < self.train_start:
@@ -96,31 +117,17 @@ class DDQNAgent:
 
         self.epsilon = max(self.epsilon * self.epsilon_decay, self.epsilon_min)
 
-        mini_batch = random.sample(self.memory, self.batch_size)
-        states = [[], [], []]
-        next_states = [[], [], []]
-        actions, rewards, dones = [], [], []
+        # states, next_states : one array per input head
+        states, actions, rewards, next_states, dones = self.memory.sample(self.batch_size)
 
-        for i in range(self.batch_size):
-            for array_idx in range(3):
-                states[array_idx].append(mini_batch[i][0][array_idx])
-                next_states[array_idx].append(mini_batch[i][3][array_idx])
-            actions.append(mini_batch[i][1])
-            rewards.append(mini_batch[i][2])
-            dones.append(mini_batch[i][4])
-
-        states = [np.array(states[0]), np.array(states[1]), np.array(states[2])]
         target = self.model.predict(states)
-        target_val = self.target_model.predict([np.array(next_states[0]), np.array(next_states[1]), np.array(next_states[2])])
+        target_val = self.target_model.predict(next_states)
+        next_q = self.model.predict(next_states) if self.double_dqn else None
 
-        for i in range(self.batch_size):
-            if dones[i]:
-                target[i][actions[i]] = rewards[i]
-            else:
-                target[i][actions[i]] = rewards[i] + self.discount_factor * (np.amax(target_val[i]))
+        target = bellman_targets(target, target_val, actions, rewards, dones, self.discount_factor, next_q)
 
         self.model.fit(states, target, batch_size=self.batch_size, epochs=1, verbose=0)
-        self.model.save('./networks/' + self.agent_type + '_rl.h5')
+        self.checkpoint.step()
 
 
 class Agents:
@@ -132,21 +139,52 @@ class Agents:
         self.agents = [bsa, boa, ssa, soa]
         self.sequence = 0
 
-        self.boa_additional_data = [1, 1, 1, 1, 1, 1, 1]
-        self.ssa_additional_data = [1, 1, 1, 1, 1, 1, 1]
-        self.soa_additional_data = [1, 1, 1, 1, 1, 1, 1]  # . 남은 시간의 이진 표현이 들어가는 자리 (테스트용임)
+        # additional data 는 state 에 기록된 뒤에도 참조로 남아 있으므로 수정할 때는 새 array 를 할당한다.
+        self.bsa_additional_data = np.ones(7, dtype=np.float32)
+        self.boa_additional_data = np.ones(7, dtype=np.float32)
+        self.ssa_additional_data = np.ones(7, dtype=np.float32)
+        self.soa_additional_data = np.ones(7, dtype=np.float32)  # . 남은 시간의 이진 표현이 들어가는 자리 (테스트용임)
 
         self.sample_buffer = list()
         self.remain_step = 0
 
     def get_action(self, state):
         state = self._process_state(state)
-        if self.sequence >= 1:
-            self.remain_step -= 1
-        if self.sequence >= 1 and self.remain_step <= self.step_limit[self.sequence]:  # limit 시간이 지나면 강제로 action = 1
+        if self._step_limit_reached():
             return 1
         return self.agents[self.sequence].get_action(state)
 
+    @staticmethod
+    def get_actions(env_agents, states):
+        """
+        actions of K environments, the states are grouped by the agent of the sequence of each environment
+        and every network runs one forward pass
+        :param env_agents: one Agents per environment, all sharing the same four DDQNAgent
+        :param states: state of each environment
+        :return: list of actions
+        """
+        actions = [None] * len(states)
+        groups = {}
+        for k, (agents, state) in enumerate(zip(env_agents, states)):
+            state = agents._process_state(state)
+            if agents._step_limit_reached():
+                actions[k] = 1
+                continue
+            agent = agents.agents[agents.sequence]
+            groups.setdefault(id(agent), (agent, [], []))
+            groups[id(agent)][1].append(k)
+            groups[id(agent)][2].append(state)
+
+        for agent, ks, group_states in groups.values():
+            for k, action in zip(ks, agent.get_actions(group_states)):
+                actions[k] = action
+        return actions
+
+    def _step_limit_reached(self):
+        if self.sequence >= 1:
+            self.remain_step -= 1
+        return self.sequence >= 1 and self.remain_step <= self.step_limit[self.sequence]  # limit 시간이 지나면 강제로 action = 1
+
     # action 에 따라 bsa - boa - ssa - soa 순서를 진행한다.
     # 순서를 진행하면서 다음 agent에 필요한 additional_data 를 작성한다.
     # 순서가 넘어갈때 필요한 다른 모든것들을 여기서 처리한다.
@@ -171,30 +209,13 @@ class Agents:
             self.sequence = 0
 
     # agent 별로 state 가 다르기 때문에 (뒤로 갈수록 추가 정보가 생김) 그 처리를 한다.
-    # additional data 자체는 sequence 가 넘어갈 때 _sequence_manage() 함수에서 생성하며, 이 함수는 그 additional data 를 state 에
-    # 추가하는 역할을 한다.
-    # 또한 agent 에 따라 input data 의 모양이 다르므로 그 처리도 여기서 한다.
-    # agent 가 전부 구체화되면 완성할 것
+    # additional data 자체는 sequence 가 넘어갈 때 _sequence_manage() 함수에서 생성하며, 이 함수는 그 additional data 를
+    # 별도의 작은 input 으로 state 에 붙인다.
+    # observation 의 market tensor 는 step 마다 새로 만들어지므로 복사하지 않고 참조로 넘긴다.
     def _process_state(self, state):
-        state = copy.deepcopy(state)
-        if self.sequence == 0:  # BSA
-            state.append([1, 1, 1, 1, 1, 1, 1])
-            # state = np.append(state, [1, 1, 1, 1, 1, 1, 1], axis=0)  # < 테스트 후 지울것 (bsa 네트워크가 없어 boa 사용중이라 넣음)
-            pass
-
-        if self.sequence == 1 and not (self.boa_additional_data is None):  # BOA
-            state.append([1, 1, 1, 1, 1, 1, 1])
-            # state = np.append(state, self.boa_additional_data, axis=0)
-
-        if self.sequence == 2 and not (self.ssa_additional_data is None):  # SSA
-            state.append([1, 1, 1, 1, 1, 1, 1])
-            # state = np.append(state, self.ssa_additional_data, axis=0)
-
-        if self.sequence == 3 and not (self.soa_additional_data is None):  # SOA
-            state.append([1, 1, 1, 1, 1, 1, 1])
-            # state = np.append(state, self.soa_additional_data, axis=0)
-
-        return np.array(state)
+        additional_data = [self.bsa_additional_data, self.boa_additional_data,
+                           self.ssa_additional_data, self.soa_additional_data][self.sequence]
+        return [state[0], state[1], additional_data]
 
     def append_sample(self, state, action, reward, next_state, done):
         # print('state length :', len(state))
@@ -234,6 +255,10 @@ class Agents:
         for agent in self.agents:
             agent.update_target_model()
 
+    def save_checkpoints(self, wait=False):
+        for agent in self.agents:
+            agent.checkpoint.save(wait=wait)
+
 
 class MyTGym(tgym.TradingGymEnv):  # MyTGym 수정해야 함 -> agent 별 reward 를 줘야 함 (4개 반환해서 agents 가 수정하거나 agent 입력해서 reward 주거나)
     # data shape
@@ -243,25 +268,35 @@ class MyTGym(tgym.TradingGymEnv):  # MyTGym 수정해야 함 -> agent 별 reward
     channels = 2
     features = 11
 
-    holder_observation = deque(np.array([[0 for x in range(52)] for y in range(seconds)]), maxlen=seconds)
+    # BSA reward : width of the price over reward_secs seconds after the step
+    reward_secs = 60
+    reward_threshold = 0.33
+
+    def __init__(self, *args, **kwargs):
+        # the last seconds observations of this env, each row is written twice (at i and i + seconds)
+        # so the window ending at the latest row is always the contiguous slice [i + 1, i + 1 + seconds)
+        self.holder_observation = np.zeros([2 * self.seconds, 52], dtype=np.float32)
+        self.holder_position = self.seconds - 1
+        super(MyTGym, self).__init__(*args, **kwargs)
+
+    def reset(self, *args, **kwargs):
+        observation = super(MyTGym, self).reset(*args, **kwargs)
+
+        # width of every step of the episode, computed once with prefix sums.
+        # past the end of the episode the last price is repeated, before the first trade the first price is used
+        price = self.d_episodes_data[self.p_current_episode_ref_idx]['quote']['Price(last excuted)']  # 데이터 자체에 오타 나 있으므로 수정 x
+        price = price.reindex(self.c_range_timestamp).ffill().bfill().values
+        price = np.concatenate([price, np.repeat(price[-1:], self.reward_secs)])
+        self.reward_width = PriceLabeler(price).width(np.arange(len(self.c_range_timestamp)),
+                                                      self.reward_secs, self.reward_threshold)
+        return observation
 
     def _rewards(self, observation, action, done, info):
         rewards = {}
-        secs = 60
+        secs = self.reward_secs
 
         # create BSA reward
-        width = 0
-        price_at_signal = None
-        threshold = 0.33
-        for j in range(secs):
-            if j == 0:
-                price_at_signal = self.d_episodes_data[self.p_current_episode_ref_idx]['quote'].loc[
-                    self.c_range_timestamp[self.p_current_step_in_episode]]['Price(last excuted)']  # 데이터 자체에 오타 나 있으므로 수정 x
-            else:
-                price = self.d_episodes_data[self.p_current_episode_ref_idx]['quote'].loc[self.c_range_timestamp[
-                    self.p_current_step_in_episode+j]]['Price(last excuted)']
-                gap = price - price_at_signal - threshold
-                width += gap
+        width = self.reward_width[self.p_current_step_in_episode]
         rewards['BSA'] = width / secs
 
         # create BOA rewrad
@@ -275,21 +310,17 @@ class MyTGym(tgym.TradingGymEnv):  # MyTGym 수정해야 함 -> agent 별 reward
         return rewards
 
     def observation_processor(self, observation):
-        self.holder_observation.append(observation)
-
-        x1 = np.zeros([self.rows, self.columns, self.seconds, self.channels])
-        x2 = np.zeros([self.seconds, self.features])
+        i = (self.holder_position + 1) % self.seconds
+        self.holder_observation[i] = observation
+        self.holder_observation[i + self.seconds] = observation
+        self.holder_position = i
 
-        for row in range(self.rows):
-            for column in range(self.columns):
-                for second in range(self.seconds):
-                    for channel in range(self.channels):
-                        x1[row][column][second][channel] = self.holder_observation[second][11 + channel*20 + column*10 + row]
-
-        for second in range(self.seconds):
-            for feature in range(self.features):
-                x2[second][feature] = self.holder_observation[second][feature]
+        # oldest second first, a row is the 11 transaction features followed by the orderbook
+        window = self.holder_observation[i + 1:i + 1 + self.seconds]
+        x1 = tensor.orderbook_tensor(window, offset=self.features)  # (rows, columns, seconds, channels)
+        x2 = tensor.transaction_tensor(window)  # (seconds, features)
 
+        # both are gathered into new arrays, never views of holder_observation, so agents keep them by reference
         return [x1, x2]
 
 if __name__ == '__main__':
@@ -317,6 +348,9 @@ if __name__ == '__main__':
             state = next_state
             agents.train_agents()
 
+        # the checkpoint of the episode is always written, after the pending one if any
+        agents.save_checkpoints(wait=True)
+
         print('step :', step_count)
         if step_count > 0:
             print('reward :', reward_sum / step_count)
@@ -0,0 +1,161 @@
+"""
+actor / learner mode of the aggregated agent
+
+python parallel.py --actors 8
+
+every actor process steps its own --envs MyTGym with a copy of the four networks, choosing the actions
+of all its environments with one forward pass per network, and sends the transitions to the learner.
+the learner keeps the replay memories of the four agents, trains them and sends the new weights back
+to the actors every --weight-interval training steps.
+"""
+import argparse
+import multiprocessing
+import queue
+import random
+import time
+
+import numpy as np
+
+from main import DDQNAgent, Agents, MyTGym
+
+AGENT_TYPES = ['bsa', 'boa', 'ssa', 'soa']
+ENV_PARAMS = dict(episode_type='0', percent_goal_profit=2, percent_stop_loss=5, episode_duration_min=60)
+
+
+def _single_thread_session():
+    # actors share the cores, each one runs its networks on one thread
+    import tensorflow as tf
+    from keras import backend as K
+    K.set_session(tf.Session(config=tf.ConfigProto(intra_op_parallelism_threads=1, inter_op_parallelism_threads=1)))
+
+
+class ActorAgent(DDQNAgent):
+    """
+    acts with a copy of the learner's network and sends its samples to the learner instead of training
+    """
+    def __init__(self, agent_type, action_size, transitions):
+        self.agent_type = agent_type
+        self.checkpoint_path = './networks/' + self.agent_type + '_rl.h5'
+        self.model = self.load_model()
+        self.action_size = action_size
+        self.epsilon = 1.0
+        self.transitions = transitions
+
+    def append_sample(self, state, action, reward, next_state, done):
+        self.transitions.put(('sample', self.agent_type, (list(state), action, reward, list(next_state), done)))
+
+    def train_model(self):
+        pass
+
+
+def run_actor(actor_id, transitions, weights, n_envs=1):
+    """
+    :param actor_id: index of the actor, every actor draws its own episodes
+    :param transitions: queue to the learner
+    :param weights: queue from the learner, holding at most the latest {agent type: (weights, epsilon)}
+    :param n_envs: environments stepped together by the actor
+    """
+    random.seed(actor_id * 7919 + int(time.time()))
+    np.random.seed((actor_id * 7919 + int(time.time())) % 2 ** 32)
+    _single_thread_session()
+
+    actor_agents = [ActorAgent(agent_type, 2, transitions) for agent_type in AGENT_TYPES]
+    envs = [MyTGym(**ENV_PARAMS) for _ in range(n_envs)]
+    # every environment has its own sequence, the networks are shared
+    env_agents = [Agents(*actor_agents) for _ in range(n_envs)]
+    states = [env.reset() for env in envs]
+    reward_sums = [0] * n_envs
+    step_counts = [0] * n_envs
+
+    while True:
+        try:
+            latest = weights.get_nowait()
+            for agent in actor_agents:
+                agent.model.set_weights(latest[agent.agent_type][0])
+                agent.epsilon = latest[agent.agent_type][1]
+        except queue.Empty:
+            pass
+
+        actions = Agents.get_actions(env_agents, states)
+        for k, (env, agents, action) in enumerate(zip(envs, env_agents, actions)):
+            next_state, reward, done, info = env.step(action)
+            reward_sums[k] += agents.append_sample(states[k], action, reward, next_state, done)
+            step_counts[k] += 1
+            states[k] = next_state
+
+            if done:
+                transitions.put(('episode', actor_id, (reward_sums[k], step_counts[k])))
+                states[k] = env.reset()
+                reward_sums[k] = 0
+                step_counts[k] = 0
+
+
+def run_learner(n_actors, n_envs=1, weight_interval=100, queue_size=10000):
+    """
+    :param n_actors: number of actor processes
+    :param n_envs: environments of each actor
+    :param weight_interval: send the weights to the actors every weight_interval training steps
+    :param queue_size: transitions waiting for the learner, the actors block when it is full
+    """
+    # spawned actors start with their own tensorflow state
+    context = multiprocessing.get_context('spawn')
+    transitions = context.Queue(maxsize=queue_size)
+    weights = [context.Queue(maxsize=1) for _ in range(n_actors)]
+    actors = [context.Process(target=run_actor, args=(i, transitions, weights[i], n_envs), daemon=True) for i in range(n_actors)]
+    for actor in actors:
+        actor.start()
+
+    learners = {agent_type: DDQNAgent(agent_type, 3120, 2) for agent_type in AGENT_TYPES}
+    train_steps = 0
+    start = time.time()
+    received = 0
+
+    while True:
+        # take what the actors sent, at least one message
+        messages = [transitions.get()]
+        try:
+            while len(messages) < n_actors * 4:
+                messages.append(transitions.get_nowait())
+        except queue.Empty:
+            pass
+
+        for kind, key, value in messages:
+            if kind == 'sample':
+                learners[key].append_sample(*value)
+                received += 1
+            else:
+                reward_sum, step_count = value
+                print('actor {} step : {}'.format(key, step_count))
+                if step_count > 0:
+                    print('actor {} reward : {}'.format(key, reward_sum / step_count))
+                print('{:.1f} samples/sec from {} actors'.format(received / (time.time() - start), n_actors))
+                for learner in learners.values():
+                    learner.checkpoint.save()
+
+        for learner in learners.values():
+            learner.train_model()
+        train_steps += 1
+
+        if train_steps % learners['bsa'].target_update_interval == 0:
+            for learner in learners.values():
+                learner.update_target_model()
+
+        if train_steps % weight_interval == 0:
+            latest = {t: (learner.model.get_weights(), learner.epsilon) for t, learner in learners.items()}
+            for q in weights:
+                # an actor which did not take the previous weights gets the new ones instead
+                try:
+                    q.get_nowait()
+                except queue.Empty:
+                    pass
+                q.put(latest)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--actors", type=int, default=multiprocessing.cpu_count() - 1, help="number of env processes")
+    parser.add_argument("--envs", type=int, default=1, help="environments stepped together by each actor")
+    parser.add_argument("--weight-interval", type=int, default=100, help="training steps between weight updates of the actors")
+    args = parser.parse_args()
+
+    run_learner(max(1, args.actors), n_envs=args.envs, weight_interval=args.weight_interval)
@@ -13,6 +13,8 @@ import numpy as np
 import pickle
 from rl.callbacks import FileLogger, ModelIntervalCheckpoint
 from core import util
+from core import dataset
+from core import tensor
 from datetime import datetime
 
 """
@@ -112,58 +114,18 @@ def get_real_data(date, ticker, save_dir, train_data_rows=None):
     :return:
     '''
 
-    x1_dimension_info = (10, 2, 120, 2)  # 60 --> 120 (@iljoo)
-    x2_dimension_info = (120, 11)
-    x3_dimension_info = (max_len,)
-    #y1_dimension_info = (120,)
-
-    pickle_name = save_dir + os.path.sep + date + '_' + ticker + '.pickle'
-    f = open(pickle_name, 'rb')
-    d = pickle.load(f)  # d[data_type][second] : mapobject!!
-    f.close()
+    d = dataset.read_dataset(save_dir, date, ticker)  # d[column][row] : memory-mapped column
 
     if train_data_rows is None:
-        train_data_rows = len(d[0])
-
-    x1 = np.zeros([10,2,120,2])
-    x2 = np.zeros([120, 11])
-    x3 = np.zeros([max_len])
-
-    d_x1 = []
-    d_x2 = []
-    d_x3 = []
-    d_y1 = []
-
-    for idx in range(train_data_rows):
-        sys.stdout.write("\rloading data from ticker %s" %ticker + ", yyyymmdd %s" %date + "  %i" % idx + " / %i 완료" % train_data_rows)
-        sys.stdout.flush()
-
-        for second in range(x1_dimension_info[2]):  # 60: seconds
-            tmp = d[0][idx][second]
-            for row in range(x1_dimension_info[0]):  # 10 : row
-                for column in range(x1_dimension_info[1]):  # 2 : column
-                    for channel in range(x1_dimension_info[3]):  # 2 : channel
-                        x1[row][column][second][channel] = tmp[channel * 20 + column * 10]
-        d_x1.append(x1)
-
-        for second in range(x2_dimension_info[0]):  # 120 : seconds
-            tmp = d[1][idx][second]
-            for feature in range(x2_dimension_info[1]):  # 11 : features
-                x2[second, feature] = tmp[feature]
-        d_x2.append(x2)
-
-        binary_second = util.seconds_to_binary_array(d[2][idx], max_len)
-        for feature in range(x3_dimension_info[0]):  # max_len :features
-            x3[feature] = binary_second[feature]
-
-        d_x3.append(x3)
+        train_data_rows = len(d['order'])
 
-        # for second in range(y1_dimension_info[0]): # 60 : seconds
-        d_y1.append(d[3][idx])
+    # x1 : (rows, 10, 2, seconds, 2), x2 : (rows, seconds, 11)
+    x1 = tensor.orderbook_tensor(d['order'][:train_data_rows])
+    x2 = tensor.transaction_tensor(d['quote'][:train_data_rows])
+    x3 = encode_time(d['left_time'][:train_data_rows])
+    y1 = np.asarray(d['y'][:train_data_rows])
 
-    sys.stdout.write("\r")
-    sys.stdout.flush()
-    return np.asarray(d_x1), np.asarray(d_x2), np.asarray(d_x3), np.asarray(d_y1)
+    return x1, x2, x3, y1
 
 
 def train_using_real_data(d, max_len, save_dir):
@@ -174,7 +136,7 @@ def train_using_real_data(d, max_len, save_dir):
     # load weight
     model.load_weights('boa_weights_final.h5f')
 
-    l = load_ticker_yyyymmdd_list_from_directory(d)
+    l = dataset.list_datasets(d)
 
     t_x1, t_x2, t_x3, t_y1 = [], [], [], []
 
@@ -203,5 +165,8 @@ def train_using_real_data(d, max_len, save_dir):
 save_dir = 'pickles'
 directory = os.path.abspath(make_dir(os.path.dirname(os.path.abspath(__file__)), save_dir))
 # max length of bit for 120
-max_len = util.get_maxlen_of_binary_array(120)
+# left/elapsed time of the dataset is at most max_secs seconds
+max_secs = dataset.max_param(directory, 'max_secs', 120)
+max_len = util.get_maxlen_of_binary_array(max_secs)
+encode_time = util.TimeEncoder(max_secs, max_len=max_len)
 train_using_real_data(directory, max_len, save_dir)
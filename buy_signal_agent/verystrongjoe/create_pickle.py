@@ -3,6 +3,7 @@ parser = argparse.ArgumentParser()
 parser.add_argument("-training", "--training", help="turn on training mode", action="store_true")
 parser.add_argument("-import-gym", "--import-gym",help="import trading gym", action="store_true")
 parser.add_argument("-gym-dir", "--gym-dir", type=str, help="import trading gym")
+parser.add_argument("-incremental", "--incremental", help="skip ticker-days already built from the same data and parameters", action="store_true")
 
 args = parser.parse_args()
 
@@ -12,12 +13,15 @@ if args.import_gym:
 
 import config
 from gym_core import ioutil  # file i/o to load stock csv files
-from collections import deque
 import pandas as pd
 import datetime
-import numpy as np
 import pickle
 import os
+from core import window
+from core import dataset
+from core import build
+from core import tickcache
+from core.label import PriceLabeler
 
 training_mode = config.BSA_PARAMS['TRAINING_MODE']
 if args.training:
@@ -46,7 +50,8 @@ previously,  I gave secs as 120. but like iljoo said, it needs to be 120.
 in other agents, it can changes but you don't have to read every time seconds periods changes
 just read maximum periods of data and reuse it   
 """
-def prepare_datasets(load_csv_dir, is_spare_dataset=False, interval=120, len_observation=60, len_sequence_secs=120, save_dir=''):
+def prepare_datasets(load_csv_dir, is_spare_dataset=False, interval=120, len_observation=60, len_sequence_secs=120, save_dir='',
+                     max_workers=None, incremental=False, quantized=None):
     """
     main coordinate fucntion to create pickle
     :param load_csv_dir : a directory where csv files to be read exist
@@ -55,32 +60,43 @@ def prepare_datasets(load_csv_dir, is_spare_dataset=False, interval=120, len_obs
     :param len_observation: only used if is_spare_dataset is true
     :param len_sequence_secs: same as prepare_sparse_dataset
     :param save_dir: root directory where pickle will save
+    :param max_workers: number of processes preparing episodes, default None : one per core
+    :param incremental: only used if is_spare_dataset is true, skip ticker-days which are up to date
+    :param quantized: only used if is_spare_dataset is true, dict of column name -> np.uint8 or np.uint16
+                      for the quantized columns, see core.dataset
     :return:
     """
     # l = ioutil.load_data_from_directory('0', max_n_episode=1) # episode type
-    l = ioutil.load_data_from_directory(load_csv_dir, '0')  # episode type
-    for li in l:
-        if is_spare_dataset:
-            try:
-                prepare_sparse_dataset(li, 120, _len_observation, save_dir)
-            except Exception as e:
-                print(str(e))
-        else:
-            prepare_dataset(li, 1, len_sequence_secs)
-
-
-def prepare_sparse_dataset(d, interval=120, len_observation=_len_observation, save_dir=''):
+    if is_spare_dataset:
+        # csv files are parsed once for the agents reading the same directory, see core.tickcache
+        l = tickcache.load_episodes(load_csv_dir, ioutil.load_data_from_directory, '0',
+                                    max_workers=max_workers)  # episode type
+        build.run_episodes(prepare_sparse_dataset, l, max_workers=max_workers, incremental=incremental,
+                           interval=120, len_observation=_len_observation, save_dir=save_dir,
+                           quantized=quantized)
+    else:
+        # prepare_dataset selects the rows of the DataFrames with .loc, the csv files are parsed here
+        l = ioutil.load_data_from_directory(load_csv_dir, '0')  # episode type
+        build.run_episodes(prepare_dataset, l, max_workers=max_workers,
+                           interval=1, len_sequence_of_secs=len_sequence_secs)
+
+
+def prepare_sparse_dataset(d, interval=120, len_observation=_len_observation, save_dir='', threshold=0.33,
+                           quantized=None):
     """
     original version
     loading data from ticker 20180403, yyyymmdd 003350 is started.
     executed time :  1538.569629558868 -> 25.6 minutes!! ( each episode would be 100 mb)
+    now windows are cut with core.window from arrays built once per episode, it takes a few seconds.
 
     This function is to get more sparse data set. It is created to make loading time from pickle into memory fast
     :param d:  same as prepare_dataset
     :param interval: same as prepare_dataset, 120 seconds. it is also for performance
     :param len_observation: Instead of 120 seconds, taking 60 seconds is just for performance
-    :param save_dir: root directory where pickle will save
-    :return: same as prepare_dataset
+    :param save_dir: root directory of the dataset, see core.dataset
+    :param threshold: same as prepare_dataset
+    :param quantized: dict of column name -> np.uint8 or np.uint16 for the columns stored quantized, see core.dataset
+    :return: nothing, it saves the ticker-day with core.dataset
     """
     current_date = d['meta']['date']
     current_ticker = d['meta']['ticker']
@@ -92,56 +108,33 @@ def prepare_sparse_dataset(d, interval=120, len_observation=_len_observation, sa
     c_rng_ts = pd.date_range(start=c_start, end=c_end,
                                     freq='S')  # range between c_start and c_end saving each seconds' data
 
-    max_idx = len(c_rng_ts) - 1
-
-    x_2d = []  # orderbook
-    x_1d = []  # transactions
-    y_1d = []  # width
-
-    for i, s in enumerate(c_rng_ts):
-
-        if i % interval != 0:
-            continue
-
-        d_x2d = deque(maxlen=_len_observation)
-        d_x1d = deque(maxlen=_len_observation)
-
-        if c_rng_ts[max_idx] < s + len_observation or i >= max_idx:
-            break
-        elif s - _len_observation < c_rng_ts[0]:
-            continue
-        else:
-            # first_quote = d['quote'].loc[s]
-            # first_order = d['order'].loc[s]
-            width = 0
-            threshold = 0.33
-
-            # assemble observation for len_observation
-            for i in reversed(range(len_observation)):
-                d_x2d.append(d['order'].loc[s-i])
-                d_x1d.append(d['quote'].loc[s-i])
-
-            # calculate width
-            for j in range(len_observation):
-                if j == 0:
-                    # price_at_signal is the price when the current stock received signal
-                    price_at_signal = d['quote'].loc[c_rng_ts[i+j]]['Price(last executed)']
-                else:
-                    price = d['quote'].loc[c_rng_ts[i+j]]['Price(last executed)']
-                    gap = price - price_at_signal - threshold
-                    width += gap
-            x_2d.append(np.array(d_x2d))
-            x_1d.append(np.array(d_x1d))
-            y_1d.append(width)
-
-    pickle_name = save_dir + os.path.sep + current_date + '_' + current_ticker + '.pickle'
-    print('{} file is created.'.format(pickle_name))
-    f = open(pickle_name, 'wb')
-    pickle.dump([x_2d, x_1d, y_1d], f)
-    f.close()
+    # order/quote are put on the per-second grid once, every window is cut out of these arrays
+    order, quote, present = window.episode_to_arrays(d, c_rng_ts)
+    price = quote[:, window.column_position(d, 'quote', 'Price(last executed)')]
+
+    signals = window.signal_indices(len(c_rng_ts), interval, len_observation, len_observation)
+    # seconds missing in the csv used to raise KeyError, now only the samples touching them are dropped
+    labeler = PriceLabeler(price)
+    complete = window.complete_windows(present, signals, len_observation) & \
+               window.complete_windows(present, signals + len_observation - 1, len_observation) & \
+               labeler.complete(signals, len_observation)
+    signals = signals[complete]
 
+    x_2d = window.extract_windows(order, signals, len_observation)  # orderbook
+    x_1d = window.extract_windows(quote, signals, len_observation)  # transactions
 
-def prepare_dataset(d, interval=1, len_sequence_of_secs=120):
+    # calculate width, price_at_signal is the price when the current stock received signal
+    y_1d = labeler.width(signals, len_observation, threshold)  # width
+
+    path = dataset.write_dataset(save_dir, current_date, current_ticker,
+                                 {'order': x_2d, 'quote': x_1d, 'y': y_1d},
+                                 params={'interval': interval, 'len_observation': len_observation,
+                                         'threshold': threshold},
+                                 quantized=quantized)
+    print('{} is created.'.format(path))
+
+
+def prepare_dataset(d, interval=1, len_sequence_of_secs=120, threshold=0.33):
     """
     :param d
         the variable having pickle file data in memory
@@ -150,14 +143,14 @@ def prepare_dataset(d, interval=1, len_sequence_of_secs=120):
         if it bring data moving 1 second forward, data size is so huge.
     :param len_sequence_of_secs:
         each observation length
+    :param threshold:
+        subtracted from the gap of each second when the width is calculated
     :return:
         nothing, it end up saving list of pickle files as you configured
     """
     current_date = d['meta']['date']
     current_ticker = d['meta']['ticker']
 
-    d_price = deque(maxlen=len_sequence_of_secs)
-
     c_start = datetime.datetime(int(current_date[0:4]), int(current_date[4:6]),
                                 int(current_date[6:8]), 9, 5)  # 9hr 5min 0sec, start time
     c_end = datetime.datetime(int(current_date[0:4]), int(current_date[4:6]),
@@ -165,40 +158,19 @@ def prepare_dataset(d, interval=1, len_sequence_of_secs=120):
     c_rng_ts = pd.date_range(start=c_start, end=c_end,
                                     freq='S')  # range between c_start and c_end saving each seconds' data
 
-    x_2d = []  # orderbook
-    x_1d = []  # transactions
-    y_1d = []  # width
-
-    max_idx = len(c_rng_ts) - 1
-
-    for i, s in enumerate(c_rng_ts):
-
-        if i % interval != 0:
-            continue
-
-        if c_rng_ts[max_idx] < c_rng_ts[i] + len_sequence_of_secs or i >= max_idx:
-            break
-        elif s - len_sequence_of_secs < c_rng_ts[0]:
-            continue
-        else:
-            first_quote = d['quote'].loc[s]
-            first_order = d['order'].loc[s]
-            width = 0
-            threshold = 0.33
-
-            # calculate width
-            for j in range(len_sequence_of_secs):
-                if j == 0:
-                    # price_at_signal is the price when the current stock received signal
-                    price_at_signal = d['quote'].loc[c_rng_ts[i+j]]['Price(last executed)']
-                else:
-                    price = d['quote'].loc[c_rng_ts[i+j]]['Price(last executed)']
-                    gap = price - price_at_signal - threshold
-                    width += gap
-
-            x_2d.append(first_order)
-            x_1d.append(first_quote)
-            y_1d.append(width)
+    _, quote, present = window.episode_to_arrays(d, c_rng_ts)
+    price = quote[:, window.column_position(d, 'quote', 'Price(last executed)')]
+
+    signals = window.signal_indices(len(c_rng_ts), interval, len_sequence_of_secs, len_sequence_of_secs)
+    labeler = PriceLabeler(price)
+    signals = signals[window.complete_windows(present, signals + len_sequence_of_secs - 1, len_sequence_of_secs) &
+                      labeler.complete(signals, len_sequence_of_secs)]
+
+    # rows stay Series, get_real_data reads them by column name
+    x_2d = [row for _, row in d['order'].loc[c_rng_ts[signals]].iterrows()]  # orderbook
+    x_1d = [row for _, row in d['quote'].loc[c_rng_ts[signals]].iterrows()]  # transactions
+    # price_at_signal is the price when the current stock received signal
+    y_1d = labeler.width(signals, len_sequence_of_secs, threshold)  # width
 
     pickle_name = current_date + '_' + current_ticker + '.pickle'
     f = open(pickle_name, 'wb')
@@ -216,4 +188,5 @@ if _save_dir == '' or _save_dir is None:
 if not os.path.isdir(_save_dir):
     os.makedirs(_save_dir)
 
-prepare_datasets(load_csv_dir=_csv_dir, is_spare_dataset=True, save_dir=_save_dir)
\ No newline at end of file
+if __name__ == '__main__':
+    prepare_datasets(load_csv_dir=_csv_dir, is_spare_dataset=True, save_dir=_save_dir, incremental=args.incremental)
\ No newline at end of file
@@ -13,6 +13,8 @@ if args.import_gym:
 from keras.models import Model
 from keras.layers import LeakyReLU, Input, Dense, Conv3D, Conv1D, Dense, Flatten, MaxPooling1D, MaxPooling2D,MaxPooling3D,Concatenate
 import numpy as np
+from core import dataset
+from core import tensor
 import pickle
 from rl.callbacks import FileLogger, ModelIntervalCheckpoint
 from gym_core import ioutil  # file i/o to load stock csv files
@@ -123,7 +125,7 @@ def build_network_for_sparsed(optimizer='adam',init_mode='uniform',
 def get_real_data_sparsed(dir, ticker='001470', date='20180420', train_data_rows=None):
     """
     Get sparsed data for supervised learning
-    :param dir : directory where pickle files exist
+    :param dir : root directory of the dataset, see core.dataset
     :param ticker: ticker number to read
     :param date: date yyyymmdd to read
     :param train_data_rows: data rows to read for training, default None : read all rows
@@ -133,45 +135,17 @@ def get_real_data_sparsed(dir, ticker='001470', date='20180420', train_data_rows
     current_ticker = ticker
     current_date = date
 
-    x1_dimension_info = (10, 2, _len_observation, 2)  # 60 --> 120 (@iljoo)
-    x2_dimension_info = (_len_observation, 11)
-    # y1_dimension_info = (120,)
-
-    pickle_name = dir + os.path.sep + current_ticker + '_' + current_date + '.pickle'
-    f = open(pickle_name, 'rb')
-    d = pickle.load(f)  # d[data_type][second] : mapobject!!
-    f.close()
-
-    total_rows = len(d[0])
+    d = dataset.read_dataset(dir, current_date, current_ticker)  # d[column][row] : memory-mapped column
 
     if train_data_rows is None:
-        train_data_rows = len(d[0])
-
-    x1 = np.zeros([10, 2, _len_observation, 2])
-    x2 = np.zeros([_len_observation, 11])
-    y1 = np.zeros([120])
-
-    d_x1 = []
-    d_x2 = []
-    d_y1 = []
-
-    for idx in range(train_data_rows):
-        for row in range(x1_dimension_info[0]):  # 10 : row
-            for column in range(x1_dimension_info[1]):  # 2 : column
-                for second in range(x1_dimension_info[2]):  # 60: seconds
-                    for channel in range(x1_dimension_info[3]):  # 2 : channel
-                        x1[row][column][second][channel] = d[0][idx][second][channel*20+column*10]
-        d_x1.append(x1)
-
-        for second in range(x2_dimension_info[0]):  # 120 : seconds
-            for feature in range(x2_dimension_info[1]):  # 11 : features
-                x2[second, feature] = d[1][idx][second][feature]
-        d_x2.append(x2)
+        train_data_rows = len(d['order'])
 
-        # for second in range(y1_dimension_info[0]): # 60 : seconds
-        d_y1.append(d[2][idx])
+    # x1 : (rows, 10, 2, seconds, 2), x2 : (rows, seconds, 11)
+    x1 = tensor.orderbook_tensor(d['order'][:train_data_rows])
+    x2 = tensor.transaction_tensor(d['quote'][:train_data_rows])
+    y1 = np.asarray(d['y'][:train_data_rows])
 
-    return np.asarray(d_x1), np.asarray(d_x2), np.asarray(d_y1)
+    return x1, x2, y1
 
 
 
@@ -256,10 +230,10 @@ model.load_weights('bsa_weight.h5f')
 
 # x1, x2, y = get_sample_sparsed_data(10) # for temporary test
 
-l = load_ticker_yyyymmdd_list_from_directory(_pickle_test_dir)
+l = dataset.list_datasets(_pickle_test_dir)
 t_x1, t_x2, t_y1 = [], [], []
 
-for (ti, da) in l:
+for (da, ti) in l:
     print('loading data from ticker {}, yyyymmdd {} is started.'.format(ti, da))
     x1, x2, y1 = load_data_sparsed(ti, da, dir=_pickle_test_dir, use_fake_data=False)
     t_x1.append(x1)
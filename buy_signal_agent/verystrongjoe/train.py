@@ -3,6 +3,9 @@ import argparse
 parser = argparse.ArgumentParser()
 parser.add_argument("-import-gym", "--import-gym",help="import trading gym", action="store_true")
 parser.add_argument("-gym-dir", "--gym-dir", type=str, help="import trading gym")
+parser.add_argument("--prefetch-workers", type=int, default=2, help="threads loading the next batches while training")
+parser.add_argument("--prefetch-depth", type=int, default=4, help="batches loaded ahead of the batch being trained")
+parser.add_argument("--prefetch-processes", help="load batches in processes instead of threads", action="store_true")
 
 args = parser.parse_args()
 
@@ -18,8 +21,13 @@ import pickle
 from rl.callbacks import FileLogger, ModelIntervalCheckpoint
 from gym_core.ioutil import *  # file i/o to load stock csv files
 import logging
-from core.scikit_learn_multi_input import KerasRegressor
-from sklearn.model_selection import GridSearchCV
+from core.scikit_learn_multi_input import MultiInput
+from core import dataset
+from core.sequence import DatasetSequence
+from core.prefetch import Prefetcher
+from core import tensor
+from core import window
+from core.search import ProcessGridSearch, SuccessiveHalving
 import os
 import pickle
 
@@ -160,10 +168,22 @@ def get_sample_data(count):
     return np.asarray(ld_x1), np.asarray(ld_x2), np.asarray(ld_y)
 
 
+def assemble_sparsed(d, rows):
+    """
+    model inputs of some rows of a ticker-day
+    :param d: ticker-day opened by dataset.read_dataset
+    :param rows: slice or sorted index array of the rows
+    :return: dict of x1 (rows, 10, 2, seconds, 2), x2 (rows, seconds, 11), and y1
+    """
+    x = {'x1': tensor.orderbook_tensor(d['order'][rows]),
+         'x2': tensor.transaction_tensor(d['quote'][rows])}
+    return x, np.asarray(d['y'][rows])
+
+
 def get_real_data_sparsed(dir, ticker='001470', date='20180420', train_data_rows=None):
     """
     Get sparsed data for supervised learning
-    :param dir : directory where pickle files exist
+    :param dir : root directory of the dataset, see core.dataset
     :param ticker: ticker number to read
     :param date: date yyyymmdd to read
     :param train_data_rows: data rows to read for training, default None : read all rows
@@ -172,45 +192,11 @@ def get_real_data_sparsed(dir, ticker='001470', date='20180420', train_data_rows
     current_ticker = ticker
     current_date = date
 
-    x1_dimension_info = (10, 2, _len_observation, 2)  # 60 --> 120 (@iljoo)
-    x2_dimension_info = (_len_observation, 11)
-    # y1_dimension_info = (120,)
-
-    pickle_name = dir + os.path.sep + current_ticker + '_' + current_date + '.pickle'
-    f = open(pickle_name, 'rb')
-    d = pickle.load(f)  # d[data_type][second] : mapobject!!
-    f.close()
-
-    total_rows = len(d[0])
+    d = dataset.read_dataset(dir, current_date, current_ticker)  # d[column][row] : memory-mapped column
 
-    if train_data_rows is None:
-        train_data_rows = len(d[0])
-
-    x1 = np.zeros([10, 2, _len_observation, 2])
-    x2 = np.zeros([_len_observation, 11])
-    y1 = np.zeros([120])
-
-    d_x1 = []
-    d_x2 = []
-    d_y1 = []
-
-    for idx in range(train_data_rows):
-        for row in range(x1_dimension_info[0]):  # 10 : row
-            for column in range(x1_dimension_info[1]):  # 2 : column
-                for second in range(x1_dimension_info[2]):  # 60: seconds
-                    for channel in range(x1_dimension_info[3]):  # 2 : channel
-                        x1[row][column][second][channel] = d[0][idx][second][channel*20+column*10]
-        d_x1.append(x1)
+    x, y1 = assemble_sparsed(d, slice(None, train_data_rows))
 
-        for second in range(x2_dimension_info[0]):  # 120 : seconds
-            for feature in range(x2_dimension_info[1]):  # 11 : features
-                x2[second, feature] = d[1][idx][second][feature]
-        d_x2.append(x2)
-
-        # for second in range(y1_dimension_info[0]): # 60 : seconds
-        d_y1.append(d[2][idx])
-
-    return np.asarray(d_x1), np.asarray(d_x2), np.asarray(d_y1)
+    return x['x1'], x['x2'], y1
 
 
 def get_real_data(ticker='001470', date='20180420', train_data_rows=None, save_dir=''):
@@ -226,59 +212,29 @@ def get_real_data(ticker='001470', date='20180420', train_data_rows=None, save_d
     current_ticker = ticker
     current_date = date
 
-    x1_dimension_info = (10, 2, 120, 2)  # 60 --> 120 (@iljoo)
-    x2_dimension_info = (120, 11)
-    # y1_dimension_info = (120,)
-
     pickle_name = save_dir + os.path.sep + current_ticker + '_' + current_date + '.pickle'
     f = open(pickle_name, 'rb')
     d = pickle.load(f)  # d[data_type][second] : mapobject!!
     f.close()
 
-    total_rows = len(d[0])
-
     if train_data_rows is None:
         train_data_rows = len(d[0])
 
-    x1 = np.zeros([10, 2, 120, 2])
-    x2 = np.zeros([120, 11])
-    y1 = np.zeros([120])
+    # one row per second, sample idx_second covers the 120 seconds starting at idx_second
+    rows = max(0, min(train_data_rows, len(d[0]) - 120 + 1))
+    if rows == 0:
+        # fewer than 120 seconds, no sample
+        x1 = tensor.orderbook_tensor(np.zeros((0, 120, len(tensor.ORDERBOOK_COLUMNS)), dtype=np.float32))
+        x2 = tensor.transaction_tensor(np.zeros((0, 120, tensor.FEATURES), dtype=np.float32))
+        return x1, x2, np.zeros(0, dtype=np.float32)
+    order = np.array([[r[name] for name in tensor.ORDERBOOK_COLUMNS] for r in d[0][:rows + 119]], dtype=np.float32)
+    quote = np.array([np.asarray(r)[:tensor.FEATURES] for r in d[1][:rows + 119]], dtype=np.float32)
 
-    d_x1 = []
-    d_x2 = []
-    d_y1 = []
+    x1 = tensor.orderbook_tensor(window.rolling_windows(order, 120))
+    x2 = tensor.transaction_tensor(window.rolling_windows(quote, 120))
+    y1 = np.asarray(d[2][:rows], dtype=np.float32)
 
-    for idx_second in range(train_data_rows):
-
-        if idx_second + 120 > total_rows:
-            break
-
-        for row in range(x1_dimension_info[0]):  # 10 : row
-            for column in range(x1_dimension_info[1]):  # 2 : column
-                for second in range(x1_dimension_info[2]):  # 120 : seconds
-                    for channel in range(x1_dimension_info[3]):  # 2 : channel
-                        key = ''
-                        if channel == 1:
-                            key = 'Buy'
-                        else:
-                            key = 'Sell'
-                        if column == 0:
-                            value = 'Hoga'
-                        else:
-                            value = 'Order'
-
-                        x1[row][column][second][channel] = d[0][idx_second+second][key+value+str(row+1)]
-        d_x1.append(x1)
-
-        for second in range(x2_dimension_info[0]):  # 120 : seconds
-            for feature in range(x2_dimension_info[1]):  # 11 : features
-                x2[second, feature] = d[1][idx_second+second][feature]
-        d_x2.append(x2)
-
-        # for second in range(y1_dimension_info[0]): # 60 : seconds
-        d_y1.append(d[2][idx_second])
-
-    return np.asarray(d_x1), np.asarray(d_x2), np.asarray(d_y1)
+    return x1, x2, y1
 
 # def train_using_fake_data():
 #     train_per_each_episode('','',True)
@@ -319,25 +275,15 @@ def get_real_data(ticker='001470', date='20180420', train_data_rows=None, save_d
 #     model.save_weights('final_weight.h5f')
 
 
-def train_using_real_data_sparsed(d):
+def train_using_real_data_sparsed(d, workers=2, depth=4, use_processes=False):
 
     model = build_network_for_sparsed(activation='leaky_relu', neurons=100)
 
-    l = load_ticker_yyyymmdd_list_from_directory(d)
-    t_x1, t_x2, t_y1 = [],[],[]
+    # ticker-days are read batch by batch while training
+    train_sequence = DatasetSequence(d, assemble_sparsed, batch_size=10)
+    prefetcher = Prefetcher(train_sequence, workers=workers, depth=depth, use_processes=use_processes)
 
-    for (ti, da) in l:
-        print('loading data from ticker {}, yyyymmdd {} is started.'.format(ti, da))
-        x1, x2, y1 = load_data_sparsed(ti, da, dir=d, use_fake_data=False)
-        t_x1.append(x1)
-        t_x2.append(x2)
-        t_y1.append(y1)
-        print('loading data from ticker {}, yyyymmdd {} is finished.'.format(ti, da))
-    t_x1 = np.concatenate(t_x1)
-    t_x2 = np.concatenate(t_x2)
-    t_y1 = np.concatenate(t_y1)
-
-    print('total x1 : {}, total x2 : {}, total y1 : {}'.format(len(t_x1), len(t_x2), len(t_y1)))
+    print('total rows : {}, batches per epoch : {}'.format(train_sequence.rows.sum(), len(train_sequence)))
 
     # {steps} --> this file will be saved whenever it runs every steps as much as {step}
     checkpoint_weights_filename = 'bsa_' + 'fill_params_information_in_here' + '_weights_{step}.h5f'
@@ -350,8 +296,8 @@ def train_using_real_data_sparsed(d):
     callbacks += [FileLogger(log_filename, interval=100)]
 
     print('start to train.')
-    history = model.fit({'x1': t_x1, 'x2': t_x2}, t_y1,
-                        epochs=1, verbose=2, batch_size=10, callbacks=callbacks)
+    history = model.fit_generator(prefetcher.flow(), steps_per_epoch=len(prefetcher), epochs=1, verbose=2,
+                                  callbacks=callbacks, workers=0)
 
     model.save('bsa_model.h5')
     model.save_weights('bsa_weight.h5f')
@@ -360,15 +306,15 @@ def train_using_real_data_sparsed(d):
         pickle.dump(history.history, file_pi)
 
 
-def train_using_real_data_sparsed_gs(d, save_dir=''):
+def train_using_real_data_sparsed_gs(d, save_dir='', n_jobs=None, search='grid'):
 
     # model = build_network_for_sparsed()
 
-    l = load_ticker_yyyymmdd_list_from_directory(d)
+    l = dataset.list_datasets(d)
 
     t_x1, t_x2, t_y1 = [],[],[]
 
-    for (ti, da) in l:
+    for (da, ti) in l:
         print('loading data from ticker {}, yyyymmdd {} is started.'.format(ti, da))
         x1, x2, y1 = load_data_sparsed(ti, da, dir=d, use_fake_data=False)
         t_x1.append(x1)
@@ -397,7 +343,9 @@ def train_using_real_data_sparsed_gs(d, save_dir=''):
     # model.save_weights('final_weight.h5f')
 
     # create model
-    model = KerasRegressor(build_fn=build_network_for_sparsed, verbose=0)
+    # samples are given to the grid search as indices into t_x1, t_x2
+    inputs = MultiInput(x1=t_x1, x2=t_x2)
+    # model = KerasRegressor(build_fn=build_network_for_sparsed, inputs=inputs, verbose=0)
 
     """
     define the grid search parameters
@@ -429,12 +377,16 @@ def train_using_real_data_sparsed_gs(d, save_dir=''):
 
     param_grid = dict(batch_size=batch_size, epochs=epochs, neurons=neurons, activation=activation)
 
-    grid = GridSearchCV(estimator=model, param_grid=param_grid, n_jobs=1)
-    # grid_result = grid.fit({'x1': t_x1, 'x2': t_x2}, t_y1)
+    # grid = GridSearchCV(estimator=model, param_grid=param_grid, n_jobs=1)
+    # grid_result = grid.fit(inputs.indices(), t_y1)
 
-    grid_result = grid.fit(
-        np.array(  [ {'x1': a, 'x2': b}  for a, b in zip(t_x1, t_x2)]),
-        t_y1)
+    if search == 'halving':
+        # candidates are trained a few epochs and only the best third goes on, up to max(epochs)
+        grid = SuccessiveHalving(build_network_for_sparsed, param_grid, n_jobs=n_jobs, verbose=0)
+    else:
+        # every (candidate, fold) is trained in its own process, n_jobs=None : one process per core
+        grid = ProcessGridSearch(build_network_for_sparsed, param_grid, n_jobs=n_jobs, verbose=0)
+    grid_result = grid.fit(inputs, t_y1)
 
     # summarize results
     print("Best: %f using %s" % (grid_result.best_score_, grid_result.best_params_))
@@ -472,4 +424,7 @@ def load_data_sparsed(t, d, dir, use_fake_data=False):
     return x1, x2, y
 
 # train_using_fake_data()
-train_using_real_data_sparsed(_pickle_training_dir)
+# the grid search workers are spawned processes importing this file, they must not start a training
+if __name__ == '__main__':
+    train_using_real_data_sparsed(_pickle_training_dir, workers=args.prefetch_workers, depth=args.prefetch_depth,
+                                  use_processes=args.prefetch_processes)
@@ -209,8 +209,8 @@ def get_real_data_sparsed(ticker='001470', date='20180420', train_data_rows=None
     if train_data_rows is None:
         train_data_rows = len(d[0])
 
-    x1 = np.zeros([10, 2, 60, 2])
-    x2 = np.zeros([60, 11])
+    x1 = np.zeros([10, 2, 60, 2], dtype=np.float32)
+    x2 = np.zeros([60, 11], dtype=np.float32)
     y1 = np.zeros([120])
 
     d_x1 = []
@@ -263,8 +263,8 @@ def get_real_data(ticker='001470', date='20180420', train_data_rows=None, save_d
     if train_data_rows is None:
         train_data_rows = len(d[0])
 
-    x1 = np.zeros([10, 2, 120, 2])
-    x2 = np.zeros([120, 11])
+    x1 = np.zeros([10, 2, 120, 2], dtype=np.float32)
+    x2 = np.zeros([120, 11], dtype=np.float32)
     y1 = np.zeros([120])
 
     d_x1 = []
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+"""
+q-learning targets of a minibatch computed at once
+"""
+import numpy as np
+
+
+def bellman_targets(q, q_next_target, actions, rewards, dones, discount_factor, q_next_online=None):
+    """
+    target of the taken actions, the other actions keep the current q values
+    dqn        : r + discount_factor * max_a q_target(s', a)
+    double dqn : r + discount_factor * q_target(s', argmax_a q_online(s', a))
+    done transitions get r only
+    :param q: q values of the states from the online model, (batch, actions)
+    :param q_next_target: q values of the next states from the target model, (batch, actions)
+    :param actions: actions taken, (batch,)
+    :param rewards: rewards, (batch,)
+    :param dones: true where the episode ended, (batch,)
+    :param discount_factor: discount of the next state value
+    :param q_next_online: q values of the next states from the online model, given for double dqn
+    :return: targets, (batch, actions), q is not modified
+    """
+    batch = np.arange(len(q))
+    if q_next_online is None:
+        next_value = np.max(q_next_target, axis=1)
+    else:
+        next_value = q_next_target[batch, np.argmax(q_next_online, axis=1)]
+
+    target = np.array(q, copy=True)
+    target[batch, np.asarray(actions, dtype=np.int64)] = \
+        rewards + discount_factor * next_value * (1. - np.asarray(dones, dtype=np.float32))
+    return target
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+parallel driver for the create_pickle scripts
+
+each ticker-day episode is handed to a worker process. only max_in_flight episodes are loaded
+into workers at the same time, and an exception in one episode is reported without stopping the others.
+in incremental mode an episode is skipped when its data and parameters hash to what its manifest recorded.
+"""
+import hashlib
+import inspect
+import json
+import os
+import random
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+import pandas as pd
+
+from core import dataset
+
+
+def episode_name(d):
+    return d['meta']['date'] + '_' + d['meta']['ticker']
+
+
+def episode_hash(d, fn, kwargs):
+    """
+    hash of the episode data together with the generation parameters
+    :param d: episode loaded by ioutil.load_data_from_directory, or ticker-day of core.tickcache
+    :param fn: function preparing the episode, its default parameters are part of the hash
+    :param kwargs: parameters given to fn, save_dir is left out
+    :return: hex digest
+    """
+    params = inspect.signature(fn).bind_partial(**kwargs)
+    params.apply_defaults()
+    params = {k: v for k, v in params.arguments.items() if k not in ('d', 'save_dir')}
+
+    h = hashlib.sha1()
+    h.update(fn.__name__.encode())
+    h.update(json.dumps(params, sort_keys=True, default=str).encode())
+    if hasattr(d, 'content_hash'):
+        # ticker-day of core.tickcache, hashed the same way when it was cached
+        h.update(d.content_hash.encode())
+        return h.hexdigest()
+    for key in ('quote', 'order'):
+        h.update(json.dumps([str(c) for c in d[key].columns]).encode())
+        h.update(pd.util.hash_pandas_object(d[key], index=True).values.tobytes())
+    return h.hexdigest()
+
+
+def _run_episode(fn, d, kwargs):
+    # forked workers share the parent's random state, every episode gets its own
+    random.seed()
+    np.random.seed()
+    start = time.time()
+    try:
+        fn(d, **kwargs)
+        return None, time.time() - start
+    except Exception:
+        return traceback.format_exc(), time.time() - start
+
+
+def run_episodes(fn, episodes, max_workers=None, max_in_flight=None, incremental=False, **kwargs):
+    """
+    call fn(episode, **kwargs) for every episode in a pool of processes
+    :param fn: module level function preparing one episode, e.g. prepare_sparse_dataset
+    :param episodes: iterable of episodes, e.g. ioutil.load_data_from_directory(...)
+    :param max_workers: number of processes, default None : one per core
+    :param max_in_flight: episodes submitted but not finished, bounds memory. default None : 2 * max_workers
+    :param incremental: if true, fn must write with core.dataset into kwargs['save_dir'].
+                        an episode whose data and parameters hash to the hash recorded in its manifest is skipped
+    :param kwargs: passed to fn
+    :return: list of finished episode names, dict of failed episode name -> traceback
+    """
+    max_workers = max_workers or os.cpu_count()
+    max_in_flight = max_in_flight or 2 * max_workers
+    total = len(episodes) if hasattr(episodes, '__len__') else '?'
+
+    finished = []
+    skipped = []
+    failed = {}
+    digests = {}
+    busy_secs = 0.
+    start = time.time()
+
+    def collect(futures):
+        nonlocal busy_secs
+        for future in futures:
+            name = pending.pop(future)
+            error, secs = future.result()
+            busy_secs += secs
+            if error is None:
+                finished.append(name)
+                if incremental:
+                    dataset.record_hash(kwargs['save_dir'], *digests.pop(name))
+            else:
+                failed[name] = error
+                print(error)
+            print('[{}/{}] {} {} in {:.1f} secs'.format(len(finished) + len(failed) + len(skipped), total, name,
+                                                      'failed' if error else 'done', secs))
+
+    pending = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for d in episodes:
+            name = episode_name(d)
+            if incremental:
+                date, ticker = d['meta']['date'], d['meta']['ticker']
+                digest = episode_hash(d, fn, kwargs)
+                if dataset.read_hash(kwargs['save_dir'], date, ticker) == digest:
+                    skipped.append(name)
+                    continue
+                digests[name] = (date, ticker, digest)
+            if len(pending) >= max_in_flight:
+                collect(wait(pending, return_when=FIRST_COMPLETED).done)
+            pending[executor.submit(_run_episode, fn, d, kwargs)] = name
+        while pending:
+            collect(wait(pending, return_when=FIRST_COMPLETED).done)
+
+    elapsed = time.time() - start
+    n = len(finished) + len(failed)
+    print('{} episodes ({} failed, {} up to date) in {:.1f} secs, {:.2f} episodes/sec, {:.1f}x speed up over one process'.format(
+        n, len(failed), len(skipped), elapsed, n / elapsed if elapsed else 0., busy_secs / elapsed if elapsed else 0.))
+    for name in failed:
+        print('failed : {}'.format(name))
+    return finished, failed
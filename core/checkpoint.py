@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+throttled checkpoints of a keras model written in the background
+
+saving the model after every gradient step caps the training speed at the disk speed.
+Checkpointer saves every every_steps steps or every_secs seconds, or when asked, e.g. at the end
+of an episode. the weights are read on the training thread with one get_weights, and a background
+thread writes them in the keras weights format to a temporary file renamed over the checkpoint,
+so a crash never leaves a truncated file. model.load_weights reads the checkpoint back.
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import h5py
+import keras
+from keras import backend as K
+
+
+def write_weights(path, layers, values):
+    """
+    write weights as model.save_weights does, through a temporary file
+    :param path: checkpoint file
+    :param layers: list of (layer name, list of weight names)
+    :param values: list of arrays, the weights of the layers in order, as from model.get_weights()
+    """
+    values = iter(values)
+    with h5py.File(path + '.tmp', 'w') as f:
+        f.attrs['layer_names'] = [name.encode('utf8') for name, _ in layers]
+        f.attrs['backend'] = K.backend().encode('utf8')
+        f.attrs['keras_version'] = str(keras.__version__).encode('utf8')
+        for name, weight_names in layers:
+            g = f.create_group(name)
+            g.attrs['weight_names'] = [w.encode('utf8') for w in weight_names]
+            for w in weight_names:
+                value = next(values)
+                dataset = g.create_dataset(w, value.shape, dtype=value.dtype)
+                if not value.shape:
+                    dataset[()] = value
+                else:
+                    dataset[:] = value
+    os.replace(path + '.tmp', path)
+
+
+class Checkpointer:
+    def __init__(self, model, path, every_steps=1000, every_secs=600.):
+        """
+        :param model: keras model to save
+        :param path: checkpoint file, .h5
+        :param every_steps: save after this many steps, None : never on steps
+        :param every_secs: save when this many seconds passed since the last save, None : never on time
+        """
+        self.model = model
+        self.path = path
+        self.every_steps = every_steps
+        self.every_secs = every_secs
+
+        # names in the order of model.get_weights()
+        self.layers = [(layer.name, [str(w.name) for w in layer.weights]) for layer in model.layers]
+
+        self.steps = 0
+        self.last_save = time.time()
+        self.writer = ThreadPoolExecutor(max_workers=1)
+        self.pending = None
+
+    def step(self):
+        """
+        count a training step and save if a checkpoint is due
+        """
+        self.steps += 1
+        if (self.every_steps and self.steps % self.every_steps == 0) or \
+                (self.every_secs and time.time() - self.last_save >= self.every_secs):
+            self.save()
+
+    def save(self, wait=False):
+        """
+        snapshot the weights and write them in the background
+        :param wait: wait for the file to be written, e.g. at the end of the training
+        :return: False if the previous checkpoint is still being written and this one was skipped
+        """
+        if self.pending is not None and not self.pending.done():
+            if not wait:
+                return False
+            self.pending.result()
+
+        self.last_save = time.time()
+        self.pending = self.writer.submit(write_weights, self.path, self.layers, self.model.get_weights())
+        if wait:
+            self.pending.result()
+        return True
+
+    def close(self):
+        self.save(wait=True)
+        self.writer.shutdown()
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+columnar dataset shared by the four agents, it replaces the per-day pickles
+
+each ticker-day is a directory {save_dir}/{date}_{ticker} holding one .npy file per column
+(order, quote, left_time, elapsed_time, y) and a manifest.json describing them.
+columns are opened with np.load(mmap_mode='r'), so opening a day costs nothing until rows are touched.
+
+the columns are written with the dtypes keras consumes : float32 for the market data and the labels,
+int32 for the times (DTYPES). a column can be quantized to uint8/uint16 with a scale and offset per
+entry of its last axis, e.g. the orderbook with one per order column, and is then decoded to float32
+when its rows are read.
+"""
+import json
+import os
+import pickle
+
+import numpy as np
+
+MANIFEST = 'manifest.json'
+
+# dtype policy of the columns, the columns not listed keep their dtype
+DTYPES = {'order': np.float32, 'quote': np.float32, 'y': np.float32,
+          'left_time': np.int32, 'elapsed_time': np.int32}
+
+
+def quantize(value, dtype=np.uint16):
+    """
+    :param value: array to quantize, a scale and an offset are computed for every entry of the last axis
+    :param dtype: unsigned integer dtype of the codes
+    :return: codes, scale, offset with value ~= codes * scale + offset
+    """
+    value = np.asarray(value, dtype=np.float64)
+    axes = tuple(range(value.ndim - 1))
+    offset = value.min(axis=axes) if value.size else np.zeros(value.shape[-1])
+    top = value.max(axis=axes) if value.size else offset
+    scale = (top - offset) / np.iinfo(dtype).max
+    scale[scale == 0] = 1.
+    codes = np.rint((value - offset) / scale).astype(dtype)
+    return codes, scale.astype(np.float32), offset.astype(np.float32)
+
+
+class QuantizedColumn(object):
+    """
+    column stored as codes, rows are decoded to float32 when they are read
+    """
+    def __init__(self, codes, scale, offset):
+        self.codes = codes
+        self.scale = np.asarray(scale, dtype=np.float32)
+        self.offset = np.asarray(offset, dtype=np.float32)
+        self.shape = codes.shape
+        self.dtype = np.dtype(np.float32)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, rows):
+        return self.codes[rows] * self.scale + self.offset
+
+    def __array__(self, dtype=None):
+        return np.asarray(self[:], dtype=dtype)
+
+
+def dataset_dir(save_dir, date, ticker):
+    return save_dir + os.path.sep + date + '_' + ticker
+
+
+def write_dataset(save_dir, date, ticker, columns, params=None, dtypes=None, quantized=None):
+    """
+    save one ticker-day
+    :param save_dir: root directory of the dataset
+    :param date: yyyymmdd
+    :param ticker: ticker number
+    :param columns: dict of column name -> array, every column has the same number of rows
+    :param params: generation parameters kept in the manifest (interval, len_observation, ...)
+    :param dtypes: dict of column name -> dtype overriding DTYPES, e.g. {'order': np.float16}
+    :param quantized: dict of column name -> np.uint8 or np.uint16 for the columns stored quantized,
+                      e.g. {'order': np.uint16}
+    :return: directory of the ticker-day
+    """
+    dtypes = dict(DTYPES, **(dtypes or {}))
+    quantized = quantized or {}
+    path = dataset_dir(save_dir, date, ticker)
+    if not os.path.isdir(path):
+        os.makedirs(path)
+
+    # the manifest is written last, a day without manifest is an interrupted write and is ignored
+    if os.path.exists(path + os.path.sep + MANIFEST):
+        os.remove(path + os.path.sep + MANIFEST)
+
+    rows = None
+    manifest = {'date': date, 'ticker': ticker, 'params': params or {}, 'columns': {}}
+    for name, value in columns.items():
+        value = np.ascontiguousarray(value, dtype=dtypes.get(name))
+        if rows is None:
+            rows = len(value)
+        elif len(value) != rows:
+            raise ValueError('column {} has {} rows, expected {}'.format(name, len(value), rows))
+        manifest['columns'][name] = {'dtype': value.dtype.str, 'shape': list(value.shape)}
+        if name in quantized:
+            value, scale, offset = quantize(value, quantized[name])
+            manifest['columns'][name].update(dtype=np.dtype(np.float32).str, codes=value.dtype.str,
+                                             scale=scale.tolist(), offset=offset.tolist())
+        np.save(path + os.path.sep + name + '.npy', value)
+    manifest['rows'] = rows or 0
+
+    with open(path + os.path.sep + MANIFEST, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return path
+
+
+def read_manifest(save_dir, date, ticker):
+    with open(dataset_dir(save_dir, date, ticker) + os.path.sep + MANIFEST) as f:
+        return json.load(f)
+
+
+def read_dataset(save_dir, date, ticker, columns=None, mmap_mode='r'):
+    """
+    open one ticker-day
+    :param save_dir: root directory of the dataset
+    :param date: yyyymmdd
+    :param ticker: ticker number
+    :param columns: names of the columns to open, default None : every column
+    :param mmap_mode: passed to np.load, None reads the columns into memory
+    :return: dict of column name -> array, or QuantizedColumn for the quantized columns
+    """
+    path = dataset_dir(save_dir, date, ticker)
+    manifest = read_manifest(save_dir, date, ticker)
+    if columns is None:
+        columns = list(manifest['columns'])
+    d = {}
+    for name in columns:
+        d[name] = np.load(path + os.path.sep + name + '.npy', mmap_mode=mmap_mode)
+        column = manifest['columns'][name]
+        if 'codes' in column:
+            d[name] = QuantizedColumn(d[name], column['scale'], column['offset'])
+    return d
+
+
+def read_hash(save_dir, date, ticker):
+    """
+    :return: source hash recorded for the ticker-day, None if it was never built or not finished
+    """
+    try:
+        return read_manifest(save_dir, date, ticker).get('source_hash')
+    except (IOError, ValueError):
+        return None
+
+
+def record_hash(save_dir, date, ticker, digest):
+    """
+    keep the hash of the source episode and generation parameters in the manifest
+    """
+    manifest = read_manifest(save_dir, date, ticker)
+    manifest['source_hash'] = digest
+    path = dataset_dir(save_dir, date, ticker) + os.path.sep + MANIFEST
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def list_datasets(save_dir):
+    """
+    :param save_dir: root directory of the dataset
+    :return: sorted list of (date, ticker) having a complete ticker-day
+    """
+    l = []
+    for name in sorted(os.listdir(save_dir)):
+        if os.path.exists(save_dir + os.path.sep + name + os.path.sep + MANIFEST):
+            date, ticker = name.split('_', 1)
+            l.append((date, ticker))
+    return l
+
+
+def max_param(save_dir, name, default=None):
+    """
+    :param save_dir: root directory of the dataset
+    :param name: generation parameter kept in the manifests, e.g. 'max_secs'
+    :param default: returned when no ticker-day records name
+    :return: largest value of name over the ticker-days
+    """
+    values = [read_manifest(save_dir, date, ticker)['params'].get(name) for date, ticker in list_datasets(save_dir)]
+    values = [v for v in values if v is not None]
+    return max(values) if values else default
+
+
+def convert_pickle(pickle_name, save_dir, names):
+    """
+    move a ticker-day written by the old create_pickle scripts into the columnar format
+    :param pickle_name: path of {date}_{ticker}.pickle
+    :param save_dir: root directory of the dataset
+    :param names: column name of each list in the pickle, e.g. ['order', 'quote', 'left_time', 'y'] for BOA
+    :return: directory of the ticker-day
+    """
+    with open(pickle_name, 'rb') as f:
+        d = pickle.load(f)
+    date, ticker = os.path.splitext(os.path.basename(pickle_name))[0].split('_', 1)
+    return write_dataset(save_dir, date, ticker, {name: np.asarray(value) for name, value in zip(names, d)})
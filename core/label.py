@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+labels computed from the price column with prefix sums
+
+every create_pickle script used to sum the future prices of each sample with .loc lookups.
+PriceLabeler keeps the cumulative sum of the price column of an episode, so any width is two reads
+whatever the horizon is, and many label definitions can be tried on the same episode.
+signals, horizons and thresholds broadcast like numpy arrays, e.g. signals[:, None] with a row of
+horizons gives one column per horizon.
+seconds missing from the csv files are nan on the grid. they count as 0 in the prefix sums, so a gap only
+affects the signals whose horizon holds it : their width is nan, and complete tells which signals to keep.
+"""
+import numpy as np
+
+
+class PriceLabeler:
+    def __init__(self, price):
+        """
+        :param price: 'Price(last executed)' column of an episode on the per-second grid
+        """
+        self.price = np.asarray(price, dtype=np.float64)
+        missing = np.isnan(self.price)
+        self.cum_price = np.concatenate([[0.], np.cumsum(np.where(missing, 0., self.price))])
+        self.cum_missing = np.concatenate([[0], np.cumsum(missing)])
+
+    def complete(self, signals, len_sequence_secs=120):
+        """
+        :param signals: index of the signal seconds
+        :param len_sequence_secs: horizon in seconds, including the signal second
+        :return: True for the signals with a price at every second of [signal, signal + len_sequence_secs)
+        """
+        i = np.asarray(signals, dtype=np.int64)
+        n = np.asarray(len_sequence_secs, dtype=np.int64)
+        return self.cum_missing[i + n] == self.cum_missing[i]
+
+    def width(self, signals, len_sequence_secs=120, threshold=0.33, sign=1):
+        """
+        area between the price and the price at signal during len_sequence_secs seconds
+        same as sum(sign * (price[i+j] - price[i]) - threshold for j in range(1, len_sequence_secs))
+        :param signals: index of the signal seconds
+        :param len_sequence_secs: horizon in seconds, including the signal second
+        :param threshold: subtracted from each second's gap
+        :param sign: 1 when a rise is rewarded (BSA), -1 when a fall is rewarded (SSA)
+        :return: width of each signal, nan when a second of its horizon is missing
+        """
+        i = np.asarray(signals, dtype=np.int64)
+        n = np.asarray(len_sequence_secs, dtype=np.int64)
+        future = self.cum_price[i + n] - self.cum_price[i + 1]
+        width = sign * (future - (n - 1) * self.price[i]) - (n - 1) * threshold
+        return np.where(self.complete(i, n), width, np.nan)
+
+    def gap(self, signals, secs, threshold=0.33, sign=1):
+        """
+        sign * (price[i+secs] - price[i]) - threshold
+        :param signals: index of the signal seconds
+        :param secs: seconds after the signal, can be an array of one value per signal
+        :param threshold: subtracted from the gap
+        :param sign: 1 when a rise is rewarded, -1 when a fall is rewarded
+        :return: gap of each signal
+        """
+        i = np.asarray(signals, dtype=np.int64)
+        return sign * (self.price[i + secs] - self.price[i]) - threshold
+
+    def returns(self, signals, secs, threshold=0.33, sign=1):
+        """
+        return in percent after secs seconds, minus threshold percent
+        :param signals: index of the signal seconds
+        :param secs: seconds after the signal, can be an array of one value per signal
+        :param threshold: subtracted from the return, in percent
+        :param sign: 1 when a rise is rewarded, -1 when a fall is rewarded
+        :return: threshold-adjusted return of each signal
+        """
+        i = np.asarray(signals, dtype=np.int64)
+        return sign * (self.price[i + secs] / self.price[i] - 1.) * 100. - threshold
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+background loading of training batches
+
+model.fit_generator waits for every batch to be read and assembled before training on it.
+Prefetcher keeps the next depth batches loading in a pool of threads or processes while the
+current one trains, and copies them into arrays allocated once, so no batch allocates memory.
+"""
+import multiprocessing
+import threading
+from collections import deque
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+
+# sequence of a worker process, see _init_process
+_sequence = None
+
+
+def _init_process(sequence):
+    global _sequence
+    _sequence = sequence
+
+
+def _load_in_process(idx, epoch):
+    # the copy of the sequence follows the shuffle of the training process
+    if epoch is not None and _sequence.epoch != epoch:
+        _sequence.set_epoch(epoch)
+    return _sequence[idx]
+
+
+class Prefetcher(object):
+    def __init__(self, sequence, workers=2, depth=4, use_processes=False):
+        """
+        :param sequence: keras Sequence giving (dict of input name -> array, y), e.g. core.sequence.DatasetSequence
+        :param workers: number of threads or processes loading batches
+        :param depth: number of batches loading ahead of the batch being trained
+        :param use_processes: load in processes, for assemble functions holding the GIL.
+                              the sequence and its assemble function must be picklable
+        """
+        self.sequence = sequence
+        self.workers = workers
+        self.depth = depth
+        self.use_processes = use_processes
+
+        # depth + 1 slots : the batches loading and the batch being trained
+        self.buffers = None
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.sequence)
+
+    def _fill(self, slot, x, y):
+        with self.lock:
+            if self.buffers is None:
+                rows = max(getattr(self.sequence, 'batch_size', 0), len(y))
+
+                def empty(a):
+                    return np.empty((rows,) + a.shape[1:], dtype=a.dtype)
+                self.buffers = [({name: empty(a) for name, a in x.items()}, empty(y)) for _ in range(self.depth + 1)]
+
+        bx, by = self.buffers[slot]
+        for name, a in x.items():
+            bx[name][:len(a)] = a
+        by[:len(y)] = y
+        return len(y)
+
+    def _load_in_thread(self, idx, slot):
+        x, y = self.sequence[idx]
+        return self._fill(slot, x, y)
+
+    def flow(self):
+        """
+        endless generator of batches, one epoch is len(self) batches
+        a batch is overwritten once the next batch is asked for, so it must be given to
+        model.fit_generator(prefetcher.flow(), steps_per_epoch=len(prefetcher), workers=0, ...) :
+        with workers=0 keras takes the batches on the training thread instead of queueing them
+        """
+        if self.use_processes:
+            pool = multiprocessing.Pool(self.workers, initializer=_init_process, initargs=(self.sequence,))
+        else:
+            pool = ThreadPool(self.workers)
+
+        try:
+            while True:
+                n = len(self.sequence)
+                epoch = getattr(self.sequence, 'epoch', None)
+                pending = deque()
+                submitted = 0
+                for _ in range(n):
+                    while submitted < n and len(pending) < self.depth:
+                        slot = submitted % (self.depth + 1)
+                        if self.use_processes:
+                            result = pool.apply_async(_load_in_process, (submitted, epoch))
+                        else:
+                            result = pool.apply_async(self._load_in_thread, (submitted, slot))
+                        pending.append((slot, result))
+                        submitted += 1
+
+                    slot, result = pending.popleft()
+                    rows = self._fill(slot, *result.get()) if self.use_processes else result.get()
+                    bx, by = self.buffers[slot]
+                    yield {name: a[:rows] for name, a in bx.items()}, by[:rows]
+
+                self.sequence.on_epoch_end()
+        finally:
+            pool.terminate()
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+replay memory of the DQN agents kept in preallocated numpy arrays
+
+a deque of (state, action, reward, next_state, done) tuples stores every state twice as float64 and
+rebuilds the minibatch with python loops. ReplayMemory keeps one float32 array per input head of the
+state, written in a ring, and the transitions only hold the index of their state and next state.
+when a transition starts from the next state of the previous one, which is the usual case, that
+observation is stored once. a minibatch is one fancy-index per array.
+
+EpisodeMemory is the store of flat states, sized for millions of transitions : one row per step of an
+episode in a float32 or float16 array, optionally a memory-mapped file, and the next state of a
+transition is the following row. only the last next state of an episode takes a row of its own.
+in memory the rows grow with the transitions up to capacity, so a large capacity costs nothing until used.
+"""
+import numpy as np
+
+
+class ReplayMemory:
+    def __init__(self, capacity, dtype=np.float32):
+        """
+        :param capacity: number of observations kept, that is capacity transitions when every transition
+                         follows the previous one, and at least capacity / 2 otherwise
+        :param dtype: dtype of the observations
+        """
+        self.capacity = capacity
+        self.dtype = dtype
+
+        # observation ring : heads[h][slot], allocated at the first append when the shapes are known
+        self.heads = None
+        self.next_slot = 0
+        self.last_slot = None
+
+        # transition ring, oldest transition at self.first
+        self.state_slot = np.zeros(capacity, dtype=np.int64)
+        self.next_state_slot = np.zeros(capacity, dtype=np.int64)
+        self.action = np.zeros(capacity, dtype=np.int64)
+        self.reward = np.zeros(capacity, dtype=np.float32)
+        self.done = np.zeros(capacity, dtype=np.bool_)
+        self.first = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def _allocate(self, state):
+        self.heads = [np.zeros((self.capacity,) + np.shape(head), dtype=self.dtype) for head in state]
+
+    def _store(self, state):
+        # the oldest observation is overwritten, with the transitions using it
+        slot = self.next_slot
+        while self.size > 0 and (self.state_slot[self.first] == slot or self.next_state_slot[self.first] == slot):
+            self.first = (self.first + 1) % self.capacity
+            self.size -= 1
+        for head, value in zip(self.heads, state):
+            head[slot] = value
+        self.next_slot = (slot + 1) % self.capacity
+        self.last_slot = slot
+        return slot
+
+    def _same_as_last(self, state):
+        if self.last_slot is None:
+            return False
+        return all(np.array_equal(head[self.last_slot], np.asarray(value, dtype=self.dtype))
+                   for head, value in zip(self.heads, state))
+
+    def append(self, state, action, reward, next_state, done):
+        """
+        :param state: list of arrays, one per input head of the model
+        :param action: action index
+        :param reward: reward
+        :param next_state: list of arrays, same shapes as state
+        :param done: true if the episode ended
+        """
+        if self.heads is None:
+            self._allocate(state)
+
+        state_slot = self.last_slot if self._same_as_last(state) else self._store(state)
+        next_state_slot = self._store(next_state)
+
+        # every transition stores its next state, so there are never more transitions than observations
+        i = (self.first + self.size) % self.capacity
+        self.state_slot[i] = state_slot
+        self.next_state_slot[i] = next_state_slot
+        self.action[i] = action
+        self.reward[i] = reward
+        self.done[i] = done
+        self.size += 1
+
+    def sample(self, batch_size):
+        """
+        draw batch_size transitions uniformly, with replacement
+        :return: states (list of arrays, one per head), actions, rewards, next_states, dones
+        """
+        i = (self.first + np.random.randint(0, self.size, size=batch_size)) % self.capacity
+        states = [head[self.state_slot[i]] for head in self.heads]
+        next_states = [head[self.next_state_slot[i]] for head in self.heads]
+        return states, self.action[i], self.reward[i], next_states, self.done[i]
+
+
+class EpisodeMemory:
+    def __init__(self, capacity, state_size, dtype=np.float32, path=None):
+        """
+        :param capacity: number of rows, a row per transition plus one per episode for its last next state
+        :param state_size: length of a state vector
+        :param dtype: dtype of the states, np.float32 or np.float16
+        :param path: file the states are memory-mapped to, default None : kept in memory, allocated as it fills
+        """
+        self.capacity = capacity
+        self.state_size = state_size
+        self.dtype = dtype
+
+        if path is None:
+            allocated = min(capacity, 1024)
+            self.states = np.zeros((allocated, state_size), dtype=dtype)
+        else:
+            allocated = capacity
+            self.states = np.memmap(path, dtype=dtype, mode='w+', shape=(capacity, state_size))
+        self.action = np.zeros(allocated, dtype=np.int8)
+        self.reward = np.zeros(allocated, dtype=np.float32)
+        self.done = np.zeros(allocated, dtype=np.bool_)
+        # valid[i] : row i starts a transition whose next state is row i + 1
+        self.valid = np.zeros(allocated, dtype=np.bool_)
+
+        self.next_row = 0
+        self.last_row = None
+        self.rows = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def _grow(self):
+        # rows are only appended before the ring is full, so growing keeps every row at its index
+        allocated = min(2 * len(self.states), self.capacity)
+        for name in ('states', 'action', 'reward', 'done', 'valid'):
+            old = getattr(self, name)
+            new = np.zeros((allocated,) + old.shape[1:], dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def _store(self, state):
+        row = self.next_row
+        if row >= len(self.states):
+            self._grow()
+        if self.valid[row]:
+            self.size -= 1
+        self.valid[row] = False
+        self.states[row] = state
+        self.next_row = (row + 1) % self.capacity
+        self.last_row = row
+        self.rows = min(self.rows + 1, self.capacity)
+        return row
+
+    def append(self, state, action, reward, next_state, done):
+        """
+        :param state: state vector
+        :param action: action index
+        :param reward: reward
+        :param next_state: state vector after the action
+        :param done: true if the episode ended
+        """
+        state = np.asarray(state, dtype=self.dtype)
+        # an episode continues from the last next state, anything else starts a new row
+        if self.last_row is None or not np.array_equal(self.states[self.last_row], state):
+            self._store(state)
+        row = self.last_row
+
+        self.action[row] = action
+        self.reward[row] = reward
+        self.done[row] = done
+        self._store(np.asarray(next_state, dtype=self.dtype))
+        self.valid[row] = True
+        self.size += 1
+
+    def sample(self, batch_size):
+        """
+        draw batch_size transitions uniformly, with replacement
+        :return: states, actions, rewards, next_states, dones, the states as float32 (batch_size, state_size)
+        """
+        rows = np.zeros(0, dtype=np.int64)
+        while len(rows) < batch_size:
+            # the rows holding only the last next state of an episode are drawn again
+            candidates = np.random.randint(0, self.rows, size=2 * batch_size)
+            rows = np.concatenate([rows, candidates[self.valid[candidates]]])
+        rows = rows[:batch_size]
+
+        states = self.states[np.concatenate([rows, (rows + 1) % self.capacity])].astype(np.float32)
+        return states[:batch_size], self.action[rows], self.reward[rows], states[batch_size:], self.done[rows]
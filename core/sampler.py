@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+seeded sample selection of the BOA/SOA dataset builders
+
+a BOA/SOA sample is a triple (signal second, left_secs, elapsed_secs). the builders used to loop over
+every signal and every elapsed_secs and keep a candidate when random.random() <= 0.001, so 999 of
+1000 iterations did nothing and a rebuilt dataset was different every time. here the number of valid
+triples of each (signal, left_secs) is computed with array arithmetic, the wanted number of
+candidates is drawn at once from a RandomState seeded by the ticker-day, and only those are decoded.
+numpy is pinned to 1.14, which has RandomState but not the Generator API.
+prepare_order_dataset is the whole builder of a BOA/SOA ticker-day, the agent scripts only give its parameters.
+"""
+import zlib
+
+import numpy as np
+
+from core import dataset
+from core import tickcache
+from core import window
+from core.label import PriceLabeler
+
+
+def episode_seed(seed, date, ticker):
+    """
+    :param seed: seed of the whole dataset
+    :param date: yyyymmdd
+    :param ticker: ticker number
+    :return: seed of the ticker-day, the same on every build
+    """
+    return (zlib.crc32('{}_{}'.format(date, ticker).encode()) + seed) % 2 ** 32
+
+
+def order_candidates(signals, n_seconds, len_sequence_secs):
+    """
+    number of valid elapsed_secs of every (signal, left_secs), same rules as the loops of the builders :
+    elapsed_secs < left_secs, the BSA signal (len_sequence_secs - left_secs + elapsed_secs seconds before)
+    is not before the market opens, and it is not later than n_seconds - len_sequence_secs
+    :param signals: index of the signal seconds
+    :param n_seconds: length of the per-second grid
+    :param len_sequence_secs: largest left_secs
+    :return: int array of shape (len(signals), len_sequence_secs), column k is left_secs = k + 1
+    """
+    i = np.asarray(signals, dtype=np.int64)[:, None]
+    left = np.arange(1, len_sequence_secs + 1)[None, :]
+    bsa_elapsed = len_sequence_secs - left
+    counts = np.clip(np.minimum(left - 1, i - bsa_elapsed) + 1, 0, None)
+    counts[i - bsa_elapsed > n_seconds - len_sequence_secs] = 0
+    return counts
+
+
+def draw(counts, n_samples, seed):
+    """
+    draw n_samples distinct candidates uniformly
+    :param counts: array from order_candidates
+    :param n_samples: number of candidates, at most counts.sum()
+    :param seed: seed of the draw, e.g. from episode_seed
+    :return: position in signals, left_secs, elapsed_secs of each candidate, sorted by signal
+    """
+    flat = counts.ravel()
+    total = int(flat.sum())
+    n_samples = min(int(n_samples), total)
+    random_state = np.random.RandomState(seed)
+
+    if n_samples * 2 > total:
+        drawn = np.sort(random_state.permutation(total)[:n_samples])
+    else:
+        # draws are sparse in the candidate space, the repeated ones are drawn again
+        drawn = np.zeros(0, dtype=np.int64)
+        while len(drawn) < n_samples:
+            more = random_state.randint(0, total, size=n_samples - len(drawn)).astype(np.int64)
+            drawn = np.unique(np.concatenate([drawn, more]))
+
+    end = np.cumsum(flat)
+    cell = np.searchsorted(end, drawn, side='right')
+    elapsed = drawn - (end[cell] - flat[cell])
+    position, left = np.divmod(cell, counts.shape[1])
+    return position, left + 1, elapsed
+
+
+def prepare_order_dataset(d, interval, len_sequence_secs, save_dir, elapsed=False, quantized=None, fill='ffill',
+                          rate=0.001, seed=0, threshold=0.33):
+    """
+    align a ticker-day on the per-second grid, draw its samples and save them with core.dataset
+    :param d: episode loaded by ioutil.load_data_from_directory, or ticker-day of core.tickcache
+    :param interval: seconds between two signals
+    :param len_sequence_secs: observation length in seconds, also the largest left_secs
+    :param save_dir: root directory of the dataset
+    :param elapsed: save the elapsed_time column too (SOA)
+    :param quantized: dict of column name -> np.uint8 or np.uint16 for the columns stored quantized
+    :param fill: 'ffill' fills the seconds missing in the csv with the previous one, 'mask' leaves them out
+    :param rate: expected fraction of the candidates saved, as the random.random() <= rate of the old loops
+    :param seed: seed of the whole dataset, see episode_seed
+    :param threshold: subtracted from the price gap of the label
+    """
+    current_date = d['meta']['date']
+    current_ticker = d['meta']['ticker']
+    c_rng_timestamp = tickcache.trading_seconds(current_date)
+
+    order, quote, valid, filled = window.align_episode(d, c_rng_timestamp, fill=fill)
+    price = quote[:, window.column_position(d, 'quote', 'Price(last excuted)')]
+
+    # only signals whose observation has every second are candidates, the BSA signal
+    # (elapsed_secs seconds before) is inside the observation too
+    signals = window.signal_indices(len(c_rng_timestamp), interval, len_sequence_secs, len_sequence_secs)
+    complete = window.complete_windows(valid, signals, len_sequence_secs)
+
+    # the expected number of samples is the one of the old loops drawing a left_secs per signal
+    # and keeping each elapsed_secs with probability rate
+    counts = order_candidates(signals[complete], len(c_rng_timestamp), len_sequence_secs)
+    n_samples = int(round(rate * counts.sum() / len_sequence_secs))
+    position, left_time, elapsed_time = draw(counts, n_samples, episode_seed(seed, current_date, current_ticker))
+    signals = signals[complete][position]
+    print('{} {} : {} seconds filled, {} of {} signals dropped for missing seconds, {} of {} candidates sampled'.format(
+        current_date, current_ticker, filled, len(complete) - np.count_nonzero(complete), len(complete),
+        len(signals), counts.sum()))
+
+    # observation of len_sequence_secs seconds up to the second the order agent acts
+    columns = {'order': window.extract_windows(order, signals, len_sequence_secs),
+               'quote': window.extract_windows(quote, signals, len_sequence_secs),
+               'left_time': left_time}
+    if elapsed:
+        columns['elapsed_time'] = elapsed_time
+    # price now - price at the BSA signal (elapsed_secs seconds before) - threshold
+    columns['y'] = PriceLabeler(price).gap(signals - elapsed_time, elapsed_time, threshold)
+
+    dataset.write_dataset(save_dir, current_date, current_ticker, columns,
+                          params={'interval': interval, 'len_sequence_secs': len_sequence_secs, 'threshold': threshold,
+                                  'fill': fill, 'rate': rate, 'seed': seed, 'max_secs': len_sequence_secs},
+                          quantized=quantized)
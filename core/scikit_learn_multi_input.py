@@ -1,4 +1,8 @@
-"""Wrapper for using the Scikit-Learn API with Keras models.
+"""Wrapper for using the Scikit-Learn API with Keras models having several named inputs.
+
+The inputs (x1, x2, ...) are held once in a `MultiInput`. Scikit-learn sees an integer
+index array as `X`, so GridSearchCV folds slice the original tensors instead of
+marshalling object arrays of per-sample dicts.
 """
 from __future__ import absolute_import
 from __future__ import division
@@ -15,6 +19,50 @@ from keras.utils.generic_utils import to_list
 from keras.models import Sequential
 from gym_core.ioutil import *  # file i/o to load stock csv files
 
+
+class MultiInput(object):
+    """Named model inputs shared by every clone of a wrapper.
+
+    # Arguments
+        **inputs: input name of the model mapped to an array,
+            every array has the same number of samples.
+
+    `clone` deep-copies estimator parameters, so a MultiInput copies to
+    itself: the grid search candidates all read the same arrays.
+    """
+
+    def __init__(self, **inputs):
+        self.inputs = inputs
+        lengths = set(len(value) for value in inputs.values())
+        if len(lengths) != 1:
+            raise ValueError('inputs have different number of samples : {}'.format(
+                {name: len(value) for name, value in inputs.items()}))
+        self.rows = lengths.pop()
+
+    def __len__(self):
+        return self.rows
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def indices(self):
+        """Returns the `X` to give to scikit-learn, the index of every sample.
+        """
+        return np.arange(self.rows)
+
+    def take(self, x):
+        """Returns the inputs of the samples `x`.
+
+        # Arguments
+            x: index array from `indices()` or a split of it,
+                or a dictionary of input arrays which is returned as is.
+        """
+        if isinstance(x, dict):
+            return x
+        x = np.asarray(x).reshape(-1)
+        return {name: value[x] for name, value in self.inputs.items()}
+
+
 class BaseWrapper(object):
     """Base class for the Keras scikit-learn wrapper.
 
@@ -23,6 +71,8 @@ class BaseWrapper(object):
 
     # Arguments
         build_fn: callable function or class instance
+        inputs: `MultiInput` holding the named inputs of the model,
+            `x` given to `fit`, `predict` and `score` indexes its samples
         **sk_params: model parameters & fitting parameters
 
     The `build_fn` should construct, compile and return a Keras model, which
@@ -56,8 +106,9 @@ class BaseWrapper(object):
     `batch_size` or `epochs` as well as the model parameters.
     """
 
-    def __init__(self, build_fn=None, **sk_params):
+    def __init__(self, build_fn=None, inputs=None, **sk_params):
         self.build_fn = build_fn
+        self.inputs = inputs
         self.sk_params = sk_params
         self.check_params(sk_params)
 
@@ -99,7 +150,7 @@ class BaseWrapper(object):
             Dictionary of parameter names mapped to their values.
         """
         res = copy.deepcopy(self.sk_params)
-        res.update({'build_fn': self.build_fn})
+        res.update({'build_fn': self.build_fn, 'inputs': self.inputs})
         return res
 
     def set_params(self, **params):
@@ -111,6 +162,8 @@ class BaseWrapper(object):
         # Returns
             self
         """
+        if 'inputs' in params:
+            self.inputs = params.pop('inputs')
         self.check_params(params)
         self.sk_params.update(params)
         return self
@@ -150,14 +203,21 @@ class BaseWrapper(object):
         fit_args = copy.deepcopy(self.filter_sk_params(Sequential.fit))
         fit_args.update(kwargs)
 
-        x0 = np.array([x[i]['x1'] for i in range(x.shape[0])])
-        x1 = np.array([x[i]['x2'] for i in range(x.shape[0])])
-        # history = self.model.fit([x0, x1], y, **fit_args)
-
-        history = self.model.fit( {'x1': x0, 'x2': x1}, y, **fit_args)
+        x = self.take(x)
+        history = self.model.fit(x, y, **fit_args)
 
         return history
 
+    def take(self, x):
+        """Returns the dictionary of inputs of the samples `x`.
+
+        # Arguments
+            x: index array into `inputs`, or a dictionary of input arrays.
+        """
+        if isinstance(x, dict):
+            return x
+        return self.inputs.take(x)
+
     def filter_sk_params(self, fn, override=None):
         """Filters `sk_params` and returns those in `fn`'s arguments.
 
@@ -233,13 +293,8 @@ class KerasClassifier(BaseWrapper):
         """
         kwargs = self.filter_sk_params(Sequential.predict_classes, kwargs)
 
-
-        # todo : update
-
-        x0 = np.array([x[i]['x1'] for i in range(x.shape[0])])
-        x1 = np.array([x[i]['x2'] for i in range(x.shape[0])])
-
-        proba = self.model.predict({'x1': x0, 'x2': x1}, **kwargs)
+        x = self.take(x)
+        proba = self.model.predict(x, **kwargs)
         if proba.shape[-1] > 1:
             classes = proba.argmax(axis=-1)
         else:
@@ -268,10 +323,8 @@ class KerasClassifier(BaseWrapper):
         """
         kwargs = self.filter_sk_params(Sequential.predict_proba, kwargs)
 
-        x0 = np.array([x[i]['x1'] for i in range(x.shape[0])])
-        x1 = np.array([x[i]['x2'] for i in range(x.shape[0])])
-
-        probs = self.model.predict({'x1': x0, 'x2': x1}, **kwargs)
+        x = self.take(x)
+        probs = self.model.predict(x, **kwargs)
 
         # check if binary classification
         if probs.shape[1] == 1:
@@ -310,11 +363,8 @@ class KerasClassifier(BaseWrapper):
         if loss_name == 'categorical_crossentropy' and len(y.shape) != 2:
             y = to_categorical(y)
 
-        x0 = np.array([x[i]['x1'] for i in range(x.shape[0])])
-        x1 = np.array([x[i]['x2'] for i in range(x.shape[0])])
-
-        outputs = self.model.evaluate({'x1': x0, 'x2': x1}, y, **kwargs)
-        
+        x = self.take(x)
+        outputs = self.model.evaluate(x, y, **kwargs)
 
         outputs = to_list(outputs)
         for name, output in zip(self.model.metrics_names, outputs):
@@ -346,10 +396,8 @@ class KerasRegressor(BaseWrapper):
         """
         kwargs = self.filter_sk_params(Sequential.predict, kwargs)
 
-        x0 = np.array([x[i]['x1'] for i in range(x.shape[0])])
-        x1 = np.array([x[i]['x2'] for i in range(x.shape[0])])
-
-        return np.squeeze(self.model.predict({'x1': x0, 'x2': x1}, **kwargs))
+        x = self.take(x)
+        return np.squeeze(self.model.predict(x, **kwargs))
 
     @runtime
     def score(self, x, y, **kwargs):
@@ -370,10 +418,8 @@ class KerasRegressor(BaseWrapper):
         """
         kwargs = self.filter_sk_params(Sequential.evaluate, kwargs)
 
-        x0 = np.array([x[i]['x1'] for i in range(x.shape[0])])
-        x1 = np.array([x[i]['x2'] for i in range(x.shape[0])])
-
-        loss = self.model.evaluate( {'x1': x0, 'x2': x1}, y, **kwargs)
+        x = self.take(x)
+        loss = self.model.evaluate(x, y, **kwargs)
 
         if isinstance(loss, list):
             return -loss[0]
@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""
+hyperparameter search of the agent networks in worker processes
+
+GridSearchCV has to run with n_jobs=1 because a keras session can not be shared between joblib workers.
+ProcessGridSearch trains every (candidate, fold) in a pool of spawned processes instead, each one with
+its own tensorflow session and thread budget. the inputs are saved once as .npy files and every worker
+opens them memory-mapped, so nothing but indices and scores goes through pickling.
+
+SuccessiveHalving trains the candidates a few epochs, keeps the best 1/eta of them on validation MAE,
+trains those further and so on, so a candidate clearly losing early does not get its full epochs.
+"""
+import itertools
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from keras.models import Sequential
+
+from core.scikit_learn_multi_input import KerasRegressor, MultiInput
+
+# inputs and labels of a worker process, see _init_worker
+_inputs = None
+_y = None
+_threads = None
+
+
+def _new_session(threads):
+    import tensorflow as tf
+    from keras import backend as K
+
+    config = tf.ConfigProto(intra_op_parallelism_threads=threads, inter_op_parallelism_threads=threads)
+    config.gpu_options.allow_growth = True
+    K.set_session(tf.Session(config=config))
+
+
+def _init_worker(paths, y_path, threads):
+    global _inputs, _y, _threads
+    _inputs = MultiInput(**{name: np.load(path, mmap_mode='r') for name, path in paths.items()})
+    _y = np.load(y_path, mmap_mode='r')
+    _threads = threads
+    _new_session(threads)
+
+
+def _folds(rows, cv):
+    # same splits as GridSearchCV(cv=3) on a regressor : consecutive folds, no shuffling
+    from sklearn.model_selection import KFold
+    return list(KFold(n_splits=cv).split(np.arange(rows)))
+
+
+def _fit_and_score(build_fn, sk_params, params, cv, fold):
+    from keras import backend as K
+
+    train, test = _folds(len(_y), cv)[fold]
+    start = time.time()
+    model = KerasRegressor(build_fn=build_fn, inputs=_inputs, **dict(sk_params, **params))
+    model.fit(train, _y[train])
+    fit_time = time.time() - start
+    score = model.score(test, _y[test])
+
+    # the next task starts from an empty graph
+    K.clear_session()
+    _new_session(_threads)
+    return score, fit_time
+
+
+def _run_task(task):
+    candidate, fold, args = task
+    return (candidate, fold) + _fit_and_score(*args)
+
+
+def _fit_epochs(build_fn, sk_params, params, validation_split, model_path, start, end):
+    from keras import backend as K
+    from keras.models import load_model
+
+    # the last validation_split of the samples is held out, as keras' validation_split does
+    rows = len(_y)
+    train, valid = np.arange(int(rows * (1. - validation_split))), np.arange(int(rows * (1. - validation_split)), rows)
+
+    regressor = KerasRegressor(build_fn=build_fn, inputs=_inputs, **dict(sk_params, **params))
+    if start > 0:
+        # the whole model with its optimizer state, so Adam's moments go on from the previous rung
+        model = load_model(model_path)
+    else:
+        model = build_fn(**regressor.filter_sk_params(build_fn))
+    fit_args = regressor.filter_sk_params(Sequential.fit)
+    fit_args.update(epochs=end, initial_epoch=start)
+    model.fit(_inputs.take(train), _y[train], **fit_args)
+    model.save(model_path)
+    mae = float(np.mean(np.abs(np.squeeze(model.predict(_inputs.take(valid))) - _y[valid])))
+
+    K.clear_session()
+    _new_session(_threads)
+    return mae
+
+
+def _run_rung_task(task):
+    candidate, args = task
+    return candidate, _fit_epochs(*args)
+
+
+def share_inputs(inputs, y, tmp_dir):
+    """
+    save the inputs and labels as .npy files the workers can memory-map
+    :param inputs: MultiInput or dict of input name -> array
+    :param y: labels
+    :param tmp_dir: directory to write in
+    :return: dict of input name -> path, path of the labels
+    """
+    if isinstance(inputs, MultiInput):
+        inputs = inputs.inputs
+    paths = {}
+    for name, value in inputs.items():
+        paths[name] = tmp_dir + os.path.sep + name + '.npy'
+        np.save(paths[name], np.asarray(value))
+    y_path = tmp_dir + os.path.sep + 'y.npy'
+    np.save(y_path, np.asarray(y))
+    return paths, y_path
+
+
+def _pool(n_jobs, paths, y_path, threads):
+    # spawned workers do not inherit the tensorflow state of this process
+    return multiprocessing.get_context('spawn').Pool(n_jobs, initializer=_init_worker, initargs=(paths, y_path, threads))
+
+
+def grid_candidates(param_grid):
+    """
+    :param param_grid: dict of parameter name -> list of values
+    :return: list of dict, one per combination
+    """
+    names = sorted(param_grid)
+    return [dict(zip(names, values)) for values in itertools.product(*[param_grid[n] for n in names])]
+
+
+class ProcessGridSearch(object):
+    def __init__(self, build_fn, param_grid, cv=3, n_jobs=None, threads_per_job=None, tmp_dir=None, **sk_params):
+        """
+        :param build_fn: module level function building and compiling the keras model
+        :param param_grid: dict of parameter name -> list of values, as for GridSearchCV
+        :param cv: number of folds
+        :param n_jobs: number of worker processes, default None : one per core
+        :param threads_per_job: tensorflow threads of a worker, default None : cores shared among the workers
+        :param tmp_dir: directory for the shared .npy files, default None : a new temporary directory
+        :param sk_params: other parameters of KerasRegressor, e.g. verbose=0
+        """
+        self.build_fn = build_fn
+        self.param_grid = param_grid
+        self.cv = cv
+        self.n_jobs = n_jobs or os.cpu_count()
+        self.threads_per_job = threads_per_job or max(1, os.cpu_count() // self.n_jobs)
+        self.tmp_dir = tmp_dir
+        self.sk_params = sk_params
+
+    def fit(self, inputs, y):
+        """
+        train and score every candidate on every fold
+        :param inputs: MultiInput or dict of input name -> array
+        :param y: labels
+        :return: self, with best_score_, best_params_ and cv_results_ as GridSearchCV
+        """
+        candidates = grid_candidates(self.param_grid)
+        tmp_dir = self.tmp_dir or tempfile.mkdtemp(prefix='grid_search_')
+        try:
+            paths, y_path = share_inputs(inputs, y, tmp_dir)
+            tasks = [(c, fold, (self.build_fn, self.sk_params, params, self.cv, fold))
+                     for c, params in enumerate(candidates) for fold in range(self.cv)]
+
+            scores = np.zeros([len(candidates), self.cv])
+            fit_times = np.zeros([len(candidates), self.cv])
+            start = time.time()
+
+            pool = _pool(min(self.n_jobs, len(tasks)), paths, y_path, self.threads_per_job)
+            try:
+                for done, (c, fold, score, fit_time) in enumerate(pool.imap_unordered(_run_task, tasks), 1):
+                    scores[c, fold] = score
+                    fit_times[c, fold] = fit_time
+                    print('[{}/{}] {} fold {} : {:f} in {:.1f} secs'.format(done, len(tasks), candidates[c], fold,
+                                                                            score, fit_time))
+            finally:
+                pool.terminate()
+        finally:
+            if self.tmp_dir is None:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        elapsed = time.time() - start
+        print('{} fits in {:.1f} secs with {} processes, {:.1f}x speed up over one process'.format(
+            len(tasks), elapsed, min(self.n_jobs, len(tasks)), fit_times.sum() / elapsed if elapsed else 0.))
+
+        self.cv_results_ = {'params': candidates,
+                            'mean_test_score': scores.mean(axis=1),
+                            'std_test_score': scores.std(axis=1),
+                            'mean_fit_time': fit_times.mean(axis=1)}
+        best = int(np.argmax(self.cv_results_['mean_test_score']))
+        self.best_index_ = best
+        self.best_score_ = self.cv_results_['mean_test_score'][best]
+        self.best_params_ = candidates[best]
+        return self
+
+
+class SuccessiveHalving(object):
+    def __init__(self, build_fn, param_grid, max_epochs=None, min_epochs=1, eta=3, validation_split=0.2,
+                 n_jobs=None, threads_per_job=None, tmp_dir=None, **sk_params):
+        """
+        :param build_fn: module level function building and compiling the keras model
+        :param param_grid: dict of parameter name -> list of values, as for GridSearchCV.
+                           epochs is the budget and is not searched, its largest value is max_epochs
+        :param max_epochs: epochs of the candidates surviving every rung, default None : largest epochs of param_grid
+        :param min_epochs: epochs of the first rung, every candidate is trained that long
+        :param eta: 1/eta of the candidates go on to the next rung, which is eta times longer
+        :param validation_split: last part of the samples used to compute the validation MAE
+        :param n_jobs: number of worker processes, default None : one per core
+        :param threads_per_job: tensorflow threads of a worker, default None : cores shared among the workers
+        :param tmp_dir: directory for the shared .npy files and the models, default None : a new temporary directory
+        :param sk_params: other parameters of KerasRegressor, e.g. verbose=0
+        """
+        # copied, epochs is taken out of the grid without changing the caller's dict
+        param_grid = dict(param_grid)
+        epochs = param_grid.pop('epochs', None)
+        if not max_epochs and not epochs:
+            raise ValueError('no epoch budget, give max_epochs or epochs in param_grid')
+        self.build_fn = build_fn
+        self.param_grid = param_grid
+        self.max_epochs = max_epochs or max(epochs)
+        self.min_epochs = min_epochs
+        self.eta = eta
+        self.validation_split = validation_split
+        self.n_jobs = n_jobs or os.cpu_count()
+        self.threads_per_job = threads_per_job or max(1, os.cpu_count() // self.n_jobs)
+        self.tmp_dir = tmp_dir
+        self.sk_params = sk_params
+
+    def budgets(self):
+        """
+        :return: epochs at the end of each rung, e.g. [1, 3, 9, 27, 70] for min_epochs=1, eta=3, max_epochs=70
+        """
+        budgets = []
+        epochs = self.min_epochs
+        while epochs < self.max_epochs:
+            budgets.append(epochs)
+            epochs *= self.eta
+        return budgets + [self.max_epochs]
+
+    def fit(self, inputs, y):
+        """
+        train the candidates rung by rung, keeping the best 1/eta on validation MAE after each rung
+        :param inputs: MultiInput or dict of input name -> array
+        :param y: labels
+        :return: self, with best_score_ (negative MAE), best_params_ and cv_results_ as GridSearchCV
+        """
+        candidates = grid_candidates(self.param_grid)
+        budgets = self.budgets()
+        mae = np.full(len(candidates), np.nan)
+        reached = np.zeros(len(candidates), dtype=np.int64)
+        alive = list(range(len(candidates)))
+        trained = 0
+
+        tmp_dir = self.tmp_dir or tempfile.mkdtemp(prefix='successive_halving_')
+        start = time.time()
+        try:
+            paths, y_path = share_inputs(inputs, y, tmp_dir)
+            pool = _pool(min(self.n_jobs, len(candidates)), paths, y_path, self.threads_per_job)
+            try:
+                for rung, epochs in enumerate(budgets):
+                    tasks = [(c, (self.build_fn, self.sk_params, candidates[c], self.validation_split,
+                                  tmp_dir + os.path.sep + 'candidate_{}.h5'.format(c), reached[c], epochs))
+                             for c in alive]
+                    for c, score in pool.imap_unordered(_run_rung_task, tasks):
+                        trained += epochs - reached[c]
+                        mae[c] = score
+                        reached[c] = epochs
+                        print('[rung {} : {} epochs] {} : validation mae {:f}'.format(rung, epochs, candidates[c], score))
+
+                    if rung < len(budgets) - 1:
+                        alive = sorted(alive, key=lambda c: mae[c])[:max(1, len(alive) // self.eta)]
+            finally:
+                pool.terminate()
+        finally:
+            if self.tmp_dir is None:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        # candidates are ranked by the rung they reached, then by their MAE there
+        best = min(range(len(candidates)), key=lambda c: (-reached[c], mae[c]))
+        full = len(candidates) * self.max_epochs
+        print('best {} with validation mae {:f}'.format(candidates[best], mae[best]))
+        print('{} of {} epochs trained in {:.1f} secs, {:.1f}% of the compute of a full grid saved'.format(
+            trained, full, time.time() - start, 100. * (full - trained) / full))
+
+        self.cv_results_ = {'params': [dict(p, epochs=int(e)) for p, e in zip(candidates, reached)],
+                            'mean_test_score': -mae,
+                            'std_test_score': np.zeros(len(candidates)),
+                            'epochs': reached}
+        self.best_index_ = best
+        self.best_score_ = -mae[best]
+        self.best_params_ = dict(candidates[best], epochs=self.max_epochs)
+        self.epochs_trained_ = trained
+        self.epochs_saved_ = full - trained
+        return self
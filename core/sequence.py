@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+training batches streamed from the columnar dataset
+
+the training scripts used to read every ticker-day and np.concatenate them before model.fit.
+DatasetSequence is a keras Sequence for model.fit_generator: a batch is assembled from the
+memory-mapped columns when keras asks for it, and samples are shuffled within a window of
+buffer_shards ticker-days, so memory stays the same whatever the number of days is.
+"""
+import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from keras.utils import Sequence
+
+from core import dataset
+
+
+class DatasetSequence(Sequence):
+    def __init__(self, save_dir, assemble, batch_size=10, shards=None, shuffle=True, buffer_shards=4, seed=None):
+        """
+        :param save_dir: root directory of the dataset
+        :param assemble: function(d, rows) -> (dict of input name -> array, y), builds the model inputs
+                         of the rows (sorted index array) of a ticker-day d opened by dataset.read_dataset
+        :param batch_size: samples per batch
+        :param shards: list of (date, ticker) to read, default None : every ticker-day in save_dir
+        :param shuffle: shuffle the samples at every epoch
+        :param buffer_shards: number of ticker-days shuffled together, a batch never reads outside two such windows
+        :param seed: seed of the shuffle, epoch e is shuffled with seed + e
+        """
+        self.save_dir = save_dir
+        self.assemble = assemble
+        self.batch_size = batch_size
+        self.shards = dataset.list_datasets(save_dir) if shards is None else list(shards)
+        self.shuffle = shuffle
+        self.buffer_shards = buffer_shards
+        self.seed = np.random.randint(2 ** 31 - 1) if seed is None else seed
+        self.epoch = -1
+        self.rows = np.array([dataset.read_manifest(save_dir, date, ticker)['rows'] for date, ticker in self.shards],
+                             dtype=np.int64)
+
+        # ticker-days opened lately, the columns are memory-mapped so only the touched pages are read
+        self.opened = OrderedDict()
+        self.lock = threading.Lock()
+        self.on_epoch_end()
+
+    def __len__(self):
+        return int(math.ceil(self.rows.sum() / float(self.batch_size)))
+
+    def __getstate__(self):
+        # sent to prefetch worker processes without the opened ticker-days
+        state = self.__dict__.copy()
+        state['opened'] = OrderedDict()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def on_epoch_end(self):
+        self.set_epoch(self.epoch + 1)
+
+    def set_epoch(self, epoch):
+        """
+        shuffle the order of the ticker-days, then the samples of each window of buffer_shards ticker-days
+        self.shard_of[i], self.row_of[i] : ticker-day and row of the i-th sample of the epoch
+        """
+        self.epoch = epoch
+        random = np.random.RandomState((self.seed + epoch) % 2 ** 32)
+        order = random.permutation(len(self.shards)) if self.shuffle else np.arange(len(self.shards))
+        shard_of, row_of = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+        for start in range(0, len(order), self.buffer_shards):
+            window = order[start:start + self.buffer_shards]
+            s = np.repeat(window, self.rows[window])
+            r = np.concatenate([np.arange(self.rows[k]) for k in window])
+            if self.shuffle:
+                p = random.permutation(len(s))
+                s, r = s[p], r[p]
+            shard_of.append(s)
+            row_of.append(r)
+        self.shard_of = np.concatenate(shard_of)
+        self.row_of = np.concatenate(row_of)
+
+    def open(self, k):
+        with self.lock:
+            if k in self.opened:
+                self.opened.move_to_end(k)
+            else:
+                date, ticker = self.shards[k]
+                self.opened[k] = dataset.read_dataset(self.save_dir, date, ticker)
+                if len(self.opened) > 2 * self.buffer_shards:
+                    self.opened.popitem(last=False)
+            return self.opened[k]
+
+    def __getitem__(self, idx):
+        shard_of = self.shard_of[idx * self.batch_size:(idx + 1) * self.batch_size]
+        row_of = self.row_of[idx * self.batch_size:(idx + 1) * self.batch_size]
+
+        xs, ys = [], []
+        for k in np.unique(shard_of):
+            x, y = self.assemble(self.open(k), np.sort(row_of[shard_of == k]))
+            xs.append(x)
+            ys.append(y)
+        return {name: np.concatenate([x[name] for x in xs]) for name in xs[0]}, np.concatenate(ys)
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""
+model inputs assembled from the dataset columns with one gather each
+
+orderbook x1 : (N, 10 rows, 2 columns, seconds, 2 channels)
+    column 0 = Hoga, 1 = Order, channel 0 = Sell, 1 = Buy,
+    taken from the order row at channel * 20 + column * 10 + row
+transactions x2 : (N, seconds, 11 features)
+"""
+import numpy as np
+
+ROWS, COLUMNS, CHANNELS, FEATURES = 10, 2, 2, 11
+
+# ORDERBOOK_INDEX[row, column, channel] is the position of the value in an order row
+ORDERBOOK_INDEX = (np.arange(CHANNELS)[None, None, :] * 20 +
+                   np.arange(COLUMNS)[None, :, None] * 10 +
+                   np.arange(ROWS)[:, None, None])
+
+# names of the order columns in the same layout, for rows keyed by column name
+ORDERBOOK_COLUMNS = [side + kind + str(row + 1)
+                     for side in ('Sell', 'Buy') for kind in ('Hoga', 'Order') for row in range(ROWS)]
+
+
+def orderbook_tensor(order, offset=0):
+    """
+    :param order: order windows of shape (N, seconds, order columns)
+    :param offset: position of the first order column, e.g. 11 when the row starts with the quote features
+    :return: x1 of shape (N, 10, 2, seconds, 2)
+    """
+    x = np.asarray(order)[..., ORDERBOOK_INDEX + offset]  # (N, seconds, 10, 2, 2)
+    return np.ascontiguousarray(np.moveaxis(x, -4, -2))
+
+
+def transaction_tensor(quote):
+    """
+    :param quote: quote windows of shape (N, seconds, quote columns)
+    :return: x2 of shape (N, seconds, 11)
+    """
+    return np.ascontiguousarray(np.asarray(quote)[..., :FEATURES])
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+from core.label import PriceLabeler
+
+
+def _width(price, i, n, threshold, sign):
+    return sum(sign * (price[i + j] - price[i]) - threshold for j in range(1, n))
+
+
+def test_width_after_gap():
+    rng = np.random.RandomState(0)
+    price = 1000. + rng.randint(-5, 6, size=60).astype(np.float64)
+    price[:3] = np.nan  # seconds before the first trade
+    price[20:22] = np.nan  # gap before the signals
+    labeler = PriceLabeler(price)
+
+    signals = np.arange(0, 50, 5)
+    width = labeler.width(signals, 10, 0.33)
+    complete = labeler.complete(signals, 10)
+
+    # only the horizons holding a missing second are marked
+    assert list(signals[~complete]) == [0, 15, 20]
+    assert np.isnan(width[~complete]).all()
+    for i, w in zip(signals[complete], width[complete]):
+        assert np.isclose(w, _width(price, i, 10, 0.33, 1))
+        assert np.isclose(labeler.width(i, 10, 0.33, sign=-1), _width(price, i, 10, 0.33, -1))
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+tick cache shared by the dataset builders of the four agents
+
+every builder used to parse the same csv episodes with ioutil.load_data_from_directory. the cache keeps
+each ticker-day as binary arrays on the per-second grid of the trading day (09:05 ~ 15:20) :
+
+    {cache_dir}/{date}_{ticker}/order.npy    (seconds, order columns) float32, nan where the second is missing
+    {cache_dir}/{date}_{ticker}/quote.npy    (seconds, quote columns) float32, nan where the second is missing
+    {cache_dir}/{date}_{ticker}/present.npy  (seconds,) bool, the second exists in both csv files
+    {cache_dir}/{date}_{ticker}/manifest.json column names and content hash of the ticker-day
+    {cache_dir}/cache.json                   fingerprint of the csv files of each ticker-day and its episodes
+
+the cache of a source directory is default_dir(csv_dir), keyed on its real path, so the builders reading the
+same directory share one parse whatever their working directory is.
+the csv files whose paths hold the same numbers of 6 digits or more (date and ticker) are one ticker-day.
+a ticker-day is parsed once, in a pool of processes, from a staging directory linking only its csv files.
+later builders open the arrays memory-mapped : only the ticker-days whose csv files are added or
+modified are parsed again, and the ones whose csv files are removed leave the cache.
+"""
+import datetime
+import hashlib
+import json
+import os
+import re
+import shutil
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from core import dataset
+from core import window
+
+CACHE = 'cache.json'
+STAGING = 'staging'
+
+# caches live next to core, shared by the scripts of every agent whatever their working directory is
+ROOT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tick_cache')
+
+
+def default_dir(csv_dir):
+    """
+    :param csv_dir: directory the episodes are loaded from
+    :return: cache directory of csv_dir under ROOT, one per source directory whatever path leads to it
+    """
+    csv_dir = os.path.realpath(csv_dir)
+    key = hashlib.sha1(csv_dir.encode()).hexdigest()[:8]
+    return os.path.join(ROOT, os.path.basename(csv_dir.rstrip(os.path.sep)) + '_' + key)
+
+
+def trading_seconds(date):
+    """
+    :param date: yyyymmdd
+    :return: pd.date_range of every second from 09:05 to 15:20
+    """
+    c_start = datetime.datetime(int(date[0:4]), int(date[4:6]), int(date[6:8]), 9, 5)
+    c_end = datetime.datetime(int(date[0:4]), int(date[4:6]), int(date[6:8]), 15, 20)
+    return pd.date_range(start=c_start, end=c_end, freq='S')
+
+
+def day_key(path):
+    """
+    :param path: path of a csv file relative to the source directory
+    :return: numbers of 6 digits or more in the path joined by '_', e.g. '20180420_001470'
+    """
+    return '_'.join(re.findall(r'\d{6,}', path))
+
+
+def source_fingerprint(csv_dir):
+    """
+    :param csv_dir: directory the episodes are loaded from
+    :return: dict of day_key -> sorted list of [relative path, size, mtime] of its csv files under csv_dir
+    """
+    days = {}
+    for root, _, names in os.walk(csv_dir):
+        for name in names:
+            if name.lower().endswith('.csv'):
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                relpath = os.path.relpath(path, csv_dir)
+                days.setdefault(day_key(relpath), []).append([relpath, stat.st_size, stat.st_mtime])
+    return {key: sorted(files) for key, files in days.items()}
+
+
+def write_day(cache_dir, d):
+    """
+    put an episode on the per-second grid and save it
+    :param cache_dir: root directory of the cache
+    :param d: episode loaded by ioutil.load_data_from_directory
+    :return: TickDay of the episode
+    """
+    date, ticker = d['meta']['date'], d['meta']['ticker']
+    path = dataset.dataset_dir(cache_dir, date, ticker)
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    if os.path.exists(path + os.path.sep + dataset.MANIFEST):
+        os.remove(path + os.path.sep + dataset.MANIFEST)
+
+    order, quote, present = window.episode_to_arrays(d, trading_seconds(date))
+    h = hashlib.sha1()
+    for key in ('quote', 'order'):
+        h.update(json.dumps([str(c) for c in d[key].columns]).encode())
+        h.update(pd.util.hash_pandas_object(d[key], index=True).values.tobytes())
+
+    np.save(path + os.path.sep + 'order.npy', order)
+    np.save(path + os.path.sep + 'quote.npy', quote)
+    np.save(path + os.path.sep + 'present.npy', present)
+    manifest = {'date': date, 'ticker': ticker, 'content_hash': h.hexdigest(),
+                'columns': {'order': [str(c) for c in d['order'].columns],
+                            'quote': [str(c) for c in d['quote'].columns]}}
+    with open(path + os.path.sep + dataset.MANIFEST, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return TickDay(cache_dir, date, ticker)
+
+
+def _build_day(csv_dir, cache_dir, key, files, load, args):
+    # the loader sees a copy of csv_dir holding only the csv files of the ticker-day
+    staging = os.path.join(cache_dir, STAGING, key, os.path.basename(os.path.abspath(csv_dir)))
+    try:
+        shutil.rmtree(os.path.dirname(staging), ignore_errors=True)
+        for relpath, _, _ in files:
+            target = os.path.join(staging, relpath)
+            if not os.path.isdir(os.path.dirname(target)):
+                os.makedirs(os.path.dirname(target))
+            try:
+                os.symlink(os.path.abspath(os.path.join(csv_dir, relpath)), target)
+            except (OSError, NotImplementedError):
+                shutil.copyfile(os.path.join(csv_dir, relpath), target)
+        days = [write_day(cache_dir, d) for d in load(staging, *args)]
+        return [[day.date, day.ticker] for day in days], None
+    except Exception:
+        return None, traceback.format_exc()
+    finally:
+        shutil.rmtree(os.path.dirname(staging), ignore_errors=True)
+
+
+def _is_cached(cache_dir, date, ticker):
+    return os.path.exists(dataset.dataset_dir(cache_dir, date, ticker) + os.path.sep + dataset.MANIFEST)
+
+
+def load_episodes(csv_dir, load, *args, cache_dir=None, max_workers=None):
+    """
+    ticker-days of the csv files, the missing or out of date ones are parsed in a pool of processes
+    :param csv_dir: directory the episodes are loaded from, its csv files decide if a ticker-day is up to date
+    :param load: module level function returning the episodes of a directory, load(directory, *args),
+                 e.g. ioutil.load_data_from_directory
+    :param args: passed to load after the directory, e.g. '0'
+    :param cache_dir: root directory of the cache, default None : default_dir(csv_dir)
+    :param max_workers: number of processes parsing ticker-days, default None : one per core
+    :return: list of TickDay, usable in place of the episodes by the builders and by core.build.run_episodes
+    """
+    cache_dir = cache_dir or default_dir(csv_dir)
+    fingerprint = source_fingerprint(csv_dir)
+    try:
+        with open(cache_dir + os.path.sep + CACHE) as f:
+            cache = json.load(f)['days']
+    except (IOError, ValueError, KeyError):
+        cache = {}
+
+    # a ticker-day is up to date when its csv files are unchanged and every episode of them is cached
+    days = {key: cache[key] for key, files in fingerprint.items()
+            if key in cache and cache[key]['files'] == files
+            and all(_is_cached(cache_dir, date, ticker) for date, ticker in cache[key]['episodes'])}
+    stale = sorted(key for key in fingerprint if key not in days)
+
+    if stale:
+        print('tick cache of {} : parsing {} of {} ticker-days into {}'.format(csv_dir, len(stale), len(fingerprint),
+                                                                             cache_dir))
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+            futures = {executor.submit(_build_day, csv_dir, cache_dir, key, fingerprint[key], load, args): key
+                       for key in stale}
+            for future in as_completed(futures):
+                key = futures[future]
+                episodes, error = future.result()
+                if error is None:
+                    # a ticker-day which failed is left out and parsed again by the next builder
+                    days[key] = {'files': fingerprint[key], 'episodes': episodes}
+                else:
+                    print('failed : {}'.format(key))
+                    print(error)
+
+    if stale or len(days) != len(cache):
+        # written last, an interrupted build parses the ticker-days again
+        with open(cache_dir + os.path.sep + CACHE + '.tmp', 'w') as f:
+            json.dump({'csv_dir': os.path.abspath(csv_dir), 'days': days}, f, indent=2)
+        os.replace(cache_dir + os.path.sep + CACHE + '.tmp', cache_dir + os.path.sep + CACHE)
+    return [TickDay(cache_dir, date, ticker) for key in sorted(days) for date, ticker in days[key]['episodes']]
+
+
+class TickDay(object):
+    """
+    one cached ticker-day. d['meta'] is as in the episodes, d['order'], d['quote'] and d['present'] are
+    the arrays on the per-second grid, opened memory-mapped at the first access.
+    pickling it sends the location only, so it is cheap to hand to worker processes.
+    """
+    on_grid = True
+
+    def __init__(self, cache_dir, date, ticker):
+        self.cache_dir = cache_dir
+        self.date = date
+        self.ticker = ticker
+        self.path = dataset.dataset_dir(cache_dir, date, ticker)
+        with open(self.path + os.path.sep + dataset.MANIFEST) as f:
+            manifest = json.load(f)
+        self.columns = manifest['columns']
+        self.content_hash = manifest['content_hash']
+        self.arrays = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['arrays'] = {}
+        return state
+
+    def __getitem__(self, key):
+        if key == 'meta':
+            return {'date': self.date, 'ticker': self.ticker}
+        if key not in self.arrays:
+            self.arrays[key] = np.load(self.path + os.path.sep + key + '.npy', mmap_mode='r')
+        return self.arrays[key]
+
+    def column(self, key, name):
+        """
+        :param key: 'order' or 'quote'
+        :param name: column name, e.g. 'Price(last executed)'
+        :return: position of the column in the array of key
+        """
+        return self.columns[key].index(name)
@@ -15,4 +15,60 @@ def discretize(data, bins):
 def get_maxlen_of_binary_array(max_seconds):
     return len(np.binary_repr(max_seconds))
 def seconds_to_binary_array(seconds, max_len):
-    return np.binary_repr(seconds).zfill(max_len)
\ No newline at end of file
+    return np.binary_repr(seconds).zfill(max_len)
+
+def binary_table(max_seconds, max_len=None):
+    """
+    binary_table(max_seconds)[s] holds the bits of seconds_to_binary_array(s, max_len), most significant first
+    :param max_seconds: largest number of seconds encoded
+    :param max_len: number of bits, default None : get_maxlen_of_binary_array(max_seconds)
+    :return: uint8 array of shape (max_seconds + 1, max_len)
+    """
+    if max_len is None:
+        max_len = get_maxlen_of_binary_array(max_seconds)
+    shifts = np.arange(max_len - 1, -1, -1)
+    return ((np.arange(max_seconds + 1)[:, None] >> shifts) & 1).astype(np.uint8)
+
+
+class TimeEncoder:
+    """
+    encodes a column of seconds (left or elapsed time) with one lookup in a precomputed table
+
+    binary  : bits of the seconds, as seconds_to_binary_array, (N, max_len) uint8
+    scaled  : seconds / max_seconds, (N, 1) float32
+    sincos  : sin and cos of the seconds as an angle of a max_seconds + 1 period, (N, 2) float32
+    onehot  : one-hot of the seconds cut in buckets equal ranges, (N, buckets) uint8
+    """
+    encodings = ('binary', 'scaled', 'sincos', 'onehot')
+
+    def __init__(self, max_seconds, encoding='binary', max_len=None, buckets=10):
+        """
+        :param max_seconds: largest number of seconds encoded
+        :param encoding: one of TimeEncoder.encodings
+        :param max_len: number of bits of the binary encoding, default None : as many as max_seconds needs
+        :param buckets: number of buckets of the onehot encoding
+        """
+        seconds = np.arange(max_seconds + 1)
+        if encoding == 'binary':
+            table = binary_table(max_seconds, max_len)
+        elif encoding == 'scaled':
+            table = (seconds / float(max_seconds))[:, None].astype(np.float32)
+        elif encoding == 'sincos':
+            angle = 2 * np.pi * seconds / float(max_seconds + 1)
+            table = np.stack([np.sin(angle), np.cos(angle)], axis=1).astype(np.float32)
+        elif encoding == 'onehot':
+            table = np.eye(buckets, dtype=np.uint8)[seconds * buckets // (max_seconds + 1)]
+        else:
+            raise ValueError('unknown time encoding {}, expected one of {}'.format(encoding, self.encodings))
+
+        self.max_seconds = max_seconds
+        self.encoding = encoding
+        self.table = table
+        self.width = table.shape[1]
+
+    def __call__(self, seconds):
+        """
+        :param seconds: int or array of seconds in [0, max_seconds]
+        :return: array of shape seconds.shape + (width,)
+        """
+        return self.table[np.asarray(seconds, dtype=np.int64)]
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+window extraction for the create_pickle scripts
+
+the order/quote DataFrames of an episode are turned into contiguous arrays on the
+per-second grid once, and every observation window is cut out of them with stride tricks
+instead of calling .loc once per second.
+"""
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+
+def episode_to_arrays(d, c_rng_ts, dtype=np.float32):
+    """
+    put the order and quote DataFrames of an episode on the per-second grid
+    :param d: episode loaded by ioutil.load_data_from_directory
+    :param c_rng_ts: pd.date_range of the trading seconds (09:05 ~ 15:20)
+    :param dtype: dtype of the arrays, see core.dataset.DTYPES
+    :return: order array (seconds, order columns), quote array (seconds, quote columns),
+             bool array telling which seconds exist in both DataFrames
+    """
+    if getattr(d, 'on_grid', False):
+        # ticker-day of core.tickcache, already on the grid
+        return d['order'], d['quote'], d['present']
+    order = d['order'].reindex(c_rng_ts)
+    quote = d['quote'].reindex(c_rng_ts)
+    present = c_rng_ts.isin(d['order'].index) & c_rng_ts.isin(d['quote'].index)
+    return np.ascontiguousarray(order.values, dtype=dtype), np.ascontiguousarray(quote.values, dtype=dtype), \
+        np.asarray(present)
+
+
+def align_episode(d, c_rng_ts, fill='ffill', max_gap=None, dtype=np.float32):
+    """
+    put an episode on the per-second grid once, filling or masking the seconds missing in the csv
+    :param d: episode loaded by ioutil.load_data_from_directory, or ticker-day of core.tickcache
+    :param c_rng_ts: pd.date_range of the trading seconds (09:05 ~ 15:20)
+    :param fill: 'ffill' : a missing second repeats the last second present, 'mask' : it stays missing
+    :param max_gap: with 'ffill', longest run of missing seconds filled, default None : no limit
+    :param dtype: dtype of the arrays, see core.dataset.DTYPES
+    :return: order array, quote array, bool validity bitmap of the seconds holding data (present or filled),
+             number of seconds filled
+    """
+    order, quote, present = episode_to_arrays(d, c_rng_ts, dtype)
+    if fill == 'mask':
+        return order, quote, np.asarray(present), 0
+    if fill != 'ffill':
+        raise ValueError("unknown fill {}, expected 'ffill' or 'mask'".format(fill))
+
+    # index of the last second present at or before each second, -1 before the first one
+    seconds = np.arange(len(present))
+    last = np.maximum.accumulate(np.where(present, seconds, -1))
+    valid = last >= 0
+    if max_gap is not None:
+        valid &= seconds - last <= max_gap
+    source = np.where(valid, last, seconds)
+    return order[source], quote[source], valid, int(valid.sum() - np.count_nonzero(present))
+
+
+def column_position(d, key, name):
+    """
+    :param d: episode loaded by ioutil.load_data_from_directory, or ticker-day of core.tickcache
+    :param key: 'order' or 'quote'
+    :param name: column name, e.g. 'Price(last executed)'
+    :return: position of the column in the arrays of episode_to_arrays
+    """
+    if getattr(d, 'on_grid', False):
+        return d.column(key, name)
+    return list(d[key].columns).index(name)
+
+
+def rolling_windows(arr, len_window):
+    """
+    read-only view of every len_window long window along the first axis, nothing is copied
+    :param arr: array of shape (seconds, ...)
+    :param len_window: window length in seconds
+    :return: view of shape (seconds - len_window + 1, len_window, ...), k-th window is arr[k:k+len_window]
+    """
+    arr = np.ascontiguousarray(arr)
+    shape = (arr.shape[0] - len_window + 1, len_window) + arr.shape[1:]
+    strides = (arr.strides[0],) + arr.strides
+    return as_strided(arr, shape=shape, strides=strides, writeable=False)
+
+
+def extract_windows(arr, ends, len_window):
+    """
+    cut the windows finishing at each index of ends (inclusive)
+    :param arr: array of shape (seconds, ...)
+    :param ends: index of the last second of each window
+    :param len_window: window length in seconds
+    :return: array of shape (len(ends), len_window, ...)
+    """
+    ends = np.asarray(ends, dtype=np.int64)
+    return rolling_windows(arr, len_window)[ends - len_window + 1]
+
+
+def signal_indices(n_seconds, interval, len_observation, len_sequence_secs):
+    """
+    indices where a sparse sample is taken, same rule as the loops in prepare_sparse_dataset
+    :param n_seconds: length of the per-second grid
+    :param interval: take a sample every interval seconds
+    :param len_observation: seconds of history needed before the signal
+    :param len_sequence_secs: seconds needed after the signal
+    :return: int array of signal indices
+    """
+    idx = np.arange(0, n_seconds, interval)
+    max_idx = n_seconds - 1
+    idx = idx[idx >= len_observation]
+    return idx[(idx + len_sequence_secs <= max_idx) & (idx < max_idx)]
+
+
+def complete_windows(present, ends, len_window):
+    """
+    tell which windows have every second present, so missing rows never get into a sample
+    :param present: bool array from episode_to_arrays
+    :param ends: index of the last second of each window
+    :param len_window: window length in seconds
+    :return: bool array of len(ends)
+    """
+    missing = np.concatenate([[0], np.cumsum(~present)])
+    ends = np.asarray(ends, dtype=np.int64)
+    return missing[ends + 1] - missing[ends + 1 - len_window] == 0
@@ -1,8 +1,9 @@
 import core.tagent as tagent
+from core.bellman import bellman_targets
+from core.replay import EpisodeMemory
 import glob
 import numpy as np
 import random
-from collections import deque
 from keras.layers import Dense
 from keras.optimizers import Adam
 from keras.models import Sequential, load_model
@@ -11,12 +12,14 @@ from keras.models import Sequential, load_model
 
 class DQNAgent(tagent.TradingAgent):
 
-    def __init__(self, state_size, action_size=2, file_dir='.', train_mode=True):
+    def __init__(self, state_size, action_size=2, file_dir='.', train_mode=True, double_dqn=False,
+                 memory_path=None, memory_dtype=np.float32):
         super().__init__()
         self.state_size = state_size
         self.action_size = action_size
         self.file_dir = file_dir
         self.train_mode = train_mode
+        self.double_dqn = double_dqn
         self.model_name = '/dqn_type_01.h5'
 
         self.discount_factor = 0.999
@@ -25,7 +28,9 @@ class DQNAgent(tagent.TradingAgent):
         self.batch_size = 1024
         self.train_start = 50000
 
-        self.memory = deque(maxlen=10000000)
+        # 10M transitions : 4 bytes per state value, allocated as the memory fills.
+        # pass memory_path to keep them in a file instead of RAM
+        self.memory = EpisodeMemory(10000000, state_size, dtype=memory_dtype, path=memory_path)
         self.model = self._load_model()
         self.target_model = self._load_model()
 
@@ -76,7 +81,7 @@ class DQNAgent(tagent.TradingAgent):
             return agent_action
 
     def append_sample(self, state, action, reward, next_state, done):
-        self.memory.append((state, action, reward, next_state, done))
+        self.memory.append(state, action, reward, next_state, done)
 
     def _decay_epsilon(self):
         pass
@@ -84,26 +89,13 @@ class DQNAgent(tagent.TradingAgent):
     def train_model(self):
         self._decay_epsilon()
 
-        mini_batch = random.sample(self.memory, self.batch_size)
-        states = np.zeros((self.batch_size, self.state_size))
-        next_states = np.zeros((self.batch_size, self.state_size))
-        actions, rewards, dones = list(), list(), list()
-
-        for i in range(self.batch_size):
-            states[i] = mini_batch[i][0]
-            actions.append(mini_batch[i][1])
-            rewards.append(mini_batch[i][2])
-            next_states[i] = mini_batch[i][3]
-            dones.append(mini_batch[i][4])
+        states, actions, rewards, next_states, dones = self.memory.sample(self.batch_size)
 
         target = self.model.predict(states)
         target_val = self.target_model.predict(next_states)
+        next_q = self.model.predict(next_states) if self.double_dqn else None
 
-        for i in range(self.batch_size):
-            if dones[i]:
-                target[i][actions[i]] = rewards[i]
-            else:
-                target[i][actions[i]] = rewards[i] + self.discount_factor * (np.amax(target_val[i]))
+        target = bellman_targets(target, target_val, actions, rewards, dones, self.discount_factor, next_q)
 
         self.model.fit(states, target, batch_size=self.batch_size, epochs=1, verbose=0)
 
@@ -7,11 +7,12 @@ from gym_core.ioutil import *  # file i/o to load stock csv files
 from keras.models import Model
 from keras.layers import Input, Dense, Conv3D, Conv1D, Dense, Flatten, MaxPooling1D, MaxPooling2D,MaxPooling3D,Concatenate
 import numpy as np
-import pickle
 from rl.callbacks import FileLogger, ModelIntervalCheckpoint
 from core import util
-from core.scikit_learn_multi_input_4 import KerasRegressor
-from sklearn.model_selection import GridSearchCV
+from core import dataset
+from core import tensor
+from core.scikit_learn_multi_input import MultiInput
+from core.search import ProcessGridSearch, SuccessiveHalving
 
 """
 build q newtork using cnn and dense layer
@@ -69,71 +70,23 @@ def get_real_data(date, ticker, save_dir, train_data_rows=None):
     :return:
     '''
 
-    x1_dimension_info = (10, 2, 120, 2)  # 60 --> 120 (@iljoo)
-    x2_dimension_info = (120, 11)
-    x3_dimension_info = (max_len,)
-    x4_dimension_info = (max_len,)
-    #y1_dimension_info = (120,)
-
-    pickle_name = save_dir + os.path.sep + date + '_' + ticker + '.pickle'
-    f = open(pickle_name, 'rb')
-    d = pickle.load(f)  # d[data_type][second] : mapobject!!
-    f.close()
+    d = dataset.read_dataset(save_dir, date, ticker)  # d[column][row] : memory-mapped column
 
     if train_data_rows is None:
-        train_data_rows = len(d[0])
-
-    x1 = np.zeros([10,2,120,2])
-    x2 = np.zeros([120, 11])
-    x3 = np.zeros([max_len])
-    x4 = np.zeros([max_len])
-
-    d_x1 = []
-    d_x2 = []
-    d_x3 = []
-    d_x4 = []
-    d_y1 = []
-
-    for idx in range(train_data_rows):
-        sys.stdout.write("\rloading data from ticker %s" %ticker + ", yyyymmdd %s" %date + "  %i" % idx + " / %i 완료" % train_data_rows)
-        sys.stdout.flush()
-
-        for second in range(x1_dimension_info[2]):  # 60: seconds
-            tmp = d[0][idx][second]
-            for row in range(x1_dimension_info[0]):  # 10 : row
-                for column in range(x1_dimension_info[1]):  # 2 : column
-                    for channel in range(x1_dimension_info[3]):  # 2 : channel
-                        x1[row][column][second][channel] = tmp[channel * 20 + column * 10]
-        d_x1.append(x1)
-
-        for second in range(x2_dimension_info[0]):  # 120 : seconds
-            tmp = d[1][idx][second]
-            for feature in range(x2_dimension_info[1]):  # 11 : features
-                x2[second, feature] = tmp[feature]
-        d_x2.append(x2)
+        train_data_rows = len(d['order'])
 
-        binary_second = util.seconds_to_binary_array(d[2][idx], max_len)
-        for feature in range(x3_dimension_info[0]):  # max_len :features
-            x3[feature] = binary_second[feature]
+    # x1 : (rows, 10, 2, seconds, 2), x2 : (rows, seconds, 11)
+    x1 = tensor.orderbook_tensor(d['order'][:train_data_rows])
+    x2 = tensor.transaction_tensor(d['quote'][:train_data_rows])
+    x3 = encode_time(d['left_time'][:train_data_rows])
+    x4 = encode_time(d['elapsed_time'][:train_data_rows])
+    y1 = np.asarray(d['y'][:train_data_rows])
 
-        d_x3.append(x3)
+    return x1, x2, x3, x4, y1
 
-        binary_second = util.seconds_to_binary_array(d[3][idx], max_len)
-        for feature in range(x4_dimension_info[0]):  # max_len :features
-            x4[feature] = binary_second[feature]
+def train_using_real_data(d, max_len, save_dir, n_jobs=None, search='grid'):
 
-        d_x4.append(x4)
-
-        # for second in range(y1_dimension_info[0]): # 60 : seconds
-        d_y1.append(d[4][idx])
-
-    sys.stdout.write("\r")
-    sys.stdout.flush()
-    return np.asarray(d_x1), np.asarray(d_x2), np.asarray(d_x3), np.asarray(d_x4), np.asarray(d_y1)
-
-def train_using_real_data(d, max_len, save_dir):
-
-    l = load_ticker_yyyymmdd_list_from_directory(d)
+    l = dataset.list_datasets(d)
 
     t_x1, t_x2, t_x3, t_x4, t_y1 = [],[],[],[],[]
 
@@ -166,7 +119,9 @@ def train_using_real_data(d, max_len, save_dir):
 
     print('start to train.')
     # create model
-    model = KerasRegressor(build_fn=build_network, verbose=0)
+    # samples are given to the grid search as indices into the input tensors
+    inputs = MultiInput(x1=t_x1, x2=t_x2, x3=t_x3, x4=t_x4)
+    # model = KerasRegressor(build_fn=build_network, inputs=inputs, verbose=0)
     # define the grid search parameters
     #batch_size = [10, 20, 40, 60, 80, 100]
     #epochs = [10, 50, 100]
@@ -176,9 +131,16 @@ def train_using_real_data(d, max_len, save_dir):
     neurons = [15, 20, 30]
     param_grid = dict(batch_size=batch_size, epochs=epochs, neurons=neurons)
 
-    grid = GridSearchCV(estimator=model, param_grid=param_grid, n_jobs=1)
-    #grid_result = grid.fit({'x1': t_x1, 'x2': t_x2, 'x3': t_x3, 'x4': t_x4}, t_y1)
-    grid_result = grid.fit(np.array([{'x1': a, 'x2': b, 'x3': c, 'x4': d} for a, b, c, d in zip(t_x1, t_x2, t_x3, t_x4)]), t_y1)
+    # grid = GridSearchCV(estimator=model, param_grid=param_grid, n_jobs=1)
+    # grid_result = grid.fit(inputs.indices(), t_y1)
+
+    if search == 'halving':
+        # candidates are trained a few epochs and only the best third goes on, up to max(epochs)
+        grid = SuccessiveHalving(build_network, param_grid, n_jobs=n_jobs, verbose=0)
+    else:
+        # every (candidate, fold) is trained in its own process, n_jobs=None : one process per core
+        grid = ProcessGridSearch(build_network, param_grid, n_jobs=n_jobs, verbose=0)
+    grid_result = grid.fit(inputs, t_y1)
 
 #    model.fit({'x1': t_x1, 'x2': t_x2, 'x3': t_x3, 'x4': t_x4}, t_y1, epochs=50, verbose=2, batch_size=64, callbacks=callbacks)
 #    model.save_weights(filepath=checkpoint_weights_filename.format(step='end_120_0_1'))
@@ -197,5 +159,12 @@ def train_using_real_data(d, max_len, save_dir):
 save_dir = 'pickles120_0_1'
 directory = os.path.abspath(make_dir(os.path.dirname(os.path.abspath(__file__)), save_dir))
 # max length of bit for 120
-max_len = util.get_maxlen_of_binary_array(120)
-train_using_real_data(directory, max_len, save_dir)
+# left/elapsed time of the dataset is at most max_secs seconds
+max_secs = dataset.max_param(directory, 'max_secs', 120)
+max_len = util.get_maxlen_of_binary_array(max_secs)
+encode_time = util.TimeEncoder(max_secs, max_len=max_len)
+# 'grid' : every candidate on 3 folds, 'halving' : successive halving on validation MAE
+search = 'grid'
+# the grid search workers are spawned processes importing this file, they must not start a search
+if __name__ == '__main__':
+    train_using_real_data(directory, max_len, save_dir, search=search)
@@ -13,6 +13,10 @@ import numpy as np
 import pickle
 from rl.callbacks import FileLogger, ModelIntervalCheckpoint
 from core import util
+from core import dataset
+from core.sequence import DatasetSequence
+from core.prefetch import Prefetcher
+from core import tensor
 from datetime import datetime
 
 """
@@ -100,6 +104,19 @@ def build_network(max_len=7, init_mode='uniform', neurons=20, activation='relu')
 
     return model
 
+def assemble_inputs(d, rows):
+    '''
+    model inputs of some rows of a ticker-day
+    :param d: ticker-day opened by dataset.read_dataset
+    :param rows: slice or sorted index array of the rows
+    :return: dict of x1, x2, x3, x4, and y1
+    '''
+    x = {'x1': tensor.orderbook_tensor(d['order'][rows]),
+         'x2': tensor.transaction_tensor(d['quote'][rows]),
+         'x3': encode_time(d['left_time'][rows]),
+         'x4': encode_time(d['elapsed_time'][rows])}
+    return x, np.asarray(d['y'][rows])
+
 def get_real_data(date, ticker, save_dir, train_data_rows=None):
     '''
     left_secs : SSA 에서 신호를 보낼때 남은 시간
@@ -114,91 +131,21 @@ def get_real_data(date, ticker, save_dir, train_data_rows=None):
     :return:
     '''
 
-    x1_dimension_info = (10, 2, 120, 2)  # 60 --> 120 (@iljoo)
-    x2_dimension_info = (120, 11)
-    x3_dimension_info = (max_len,)
-    x4_dimension_info = (max_len,)
-    #y1_dimension_info = (120,)
-
-    pickle_name = save_dir + os.path.sep + date + '_' + ticker + '.pickle'
-    f = open(pickle_name, 'rb')
-    d = pickle.load(f)  # d[data_type][second] : mapobject!!
-    f.close()
-
-    if train_data_rows is None:
-        train_data_rows = len(d[0])
-
-    x1 = np.zeros([10,2,120,2])
-    x2 = np.zeros([120, 11])
-    x3 = np.zeros([max_len])
-    x4 = np.zeros([max_len])
-
-    d_x1 = []
-    d_x2 = []
-    d_x3 = []
-    d_x4 = []
-    d_y1 = []
-
-    for idx in range(train_data_rows):
-        sys.stdout.write("\rloading data from ticker %s" %ticker + ", yyyymmdd %s" %date + "  %i" % idx + " / %i 완료" % train_data_rows)
-        sys.stdout.flush()
-
-        for second in range(x1_dimension_info[2]):  # 60: seconds
-            tmp = d[0][idx][second]
-            for row in range(x1_dimension_info[0]):  # 10 : row
-                for column in range(x1_dimension_info[1]):  # 2 : column
-                    for channel in range(x1_dimension_info[3]):  # 2 : channel
-                        x1[row][column][second][channel] = tmp[channel * 20 + column * 10]
-        d_x1.append(x1)
-
-        for second in range(x2_dimension_info[0]):  # 120 : seconds
-            tmp = d[1][idx][second]
-            for feature in range(x2_dimension_info[1]):  # 11 : features
-                x2[second, feature] = tmp[feature]
-        d_x2.append(x2)
-
-        binary_second = util.seconds_to_binary_array(d[2][idx], max_len)
-        for feature in range(x3_dimension_info[0]):  # max_len :features
-            x3[feature] = binary_second[feature]
-
-        d_x3.append(x3)
-
-        binary_second = util.seconds_to_binary_array(d[3][idx], max_len)
-        for feature in range(x4_dimension_info[0]):  # max_len :features
-            x4[feature] = binary_second[feature]
-
-        d_x4.append(x4)
-
-        # for second in range(y1_dimension_info[0]): # 60 : seconds
-        d_y1.append(d[4][idx])
-
-    sys.stdout.write("\r")
-    sys.stdout.flush()
-    return np.asarray(d_x1), np.asarray(d_x2), np.asarray(d_x3), np.asarray(d_x4), np.asarray(d_y1)
-
-def train_using_real_data(d, max_len, save_dir):
+    d = dataset.read_dataset(save_dir, date, ticker)  # d[column][row] : memory-mapped column
+
+    x, y1 = assemble_inputs(d, slice(None, train_data_rows))
+
+    return x['x1'], x['x2'], x['x3'], x['x4'], y1
+
+def train_using_real_data(d, max_len, save_dir, workers=2, depth=4, use_processes=False):
     model = build_network(max_len, neurons=100, activation='leaky_relu')
     model.compile(optimizer='adam', loss='mse', metrics=['mae', 'mape'])
     model.summary()
 
-    l = load_ticker_yyyymmdd_list_from_directory(d)
-
-    t_x1, t_x2, t_x3, t_x4, t_y1 = [],[],[],[],[]
-
-    for (da, ti) in l:
-        x1, x2, x3, x4, y1 = get_real_data(da, ti, save_dir=save_dir)
-        t_x1.append(x1)
-        t_x2.append(x2)
-        t_x3.append(x3)
-        t_x4.append(x4)
-        t_y1.append(y1)
-        print('loading data from ticker {}, yyyymmdd {} is finished.'.format(ti, da))
-    t_x1 = np.concatenate(t_x1)
-    t_x2 = np.concatenate(t_x2)
-    t_x3 = np.concatenate(t_x3)
-    t_x4 = np.concatenate(t_x4)
-    t_y1 = np.concatenate(t_y1)
-    print('total x1 : {}, total x2 : {}, total x3 : {}, total x4 : {}, total y1 : {}'.format(len(t_x1), len(t_x2), len(t_x3), len(t_x4), len(t_y1)))
+    # ticker-days are read batch by batch while training
+    train_sequence = DatasetSequence(d, assemble_inputs, batch_size=10)
+    prefetcher = Prefetcher(train_sequence, workers=workers, depth=depth, use_processes=use_processes)
+    print('total rows : {}, batches per epoch : {}'.format(train_sequence.rows.sum(), len(train_sequence)))
 
     # {steps} --> this file will be saved whenver it runs every steps as much as {step}
     checkpoint_weights_filename = 'soa_weights_{step}.h5f'
@@ -213,7 +160,8 @@ def train_using_real_data(d, max_len, save_dir):
     callbacks += [FileLogger(log_filename, interval=100)]
 
     print('start to train.')
-    history = model.fit({'x1': t_x1, 'x2': t_x2, 'x3': t_x3, 'x4': t_x4}, t_y1, epochs=70, verbose=2, batch_size=10, callbacks=callbacks)
+    history = model.fit_generator(prefetcher.flow(), steps_per_epoch=len(prefetcher), epochs=70, verbose=2,
+                                  callbacks=callbacks, workers=0)
 
     with open(datetime.now().strftime('soa_model_history_%Y%m%d_%H%M%S'), 'wb') as file_pi:
         pickle.dump(history.history, file_pi)
@@ -226,5 +174,13 @@ def train_using_real_data(d, max_len, save_dir):
 save_dir = 'pickles120_0_1'
 directory = os.path.abspath(make_dir(os.path.dirname(os.path.abspath(__file__)), save_dir))
 # max length of bit for 120
-max_len = util.get_maxlen_of_binary_array(120)
-train_using_real_data(directory, max_len, save_dir)
+# left/elapsed time of the dataset is at most max_secs seconds
+max_secs = dataset.max_param(directory, 'max_secs', 120)
+max_len = util.get_maxlen_of_binary_array(max_secs)
+encode_time = util.TimeEncoder(max_secs, max_len=max_len)
+# threads (or processes) loading the next prefetch_depth batches while a batch trains
+prefetch_workers = 2
+prefetch_depth = 4
+prefetch_processes = False
+train_using_real_data(directory, max_len, save_dir, workers=prefetch_workers, depth=prefetch_depth,
+                      use_processes=prefetch_processes)
@@ -6,7 +6,6 @@ sys.path.append(newPath)
 
 
 from gym_core import ioutil  # file i/o to load stock csv files
-from collections import deque
 import config
 import pandas as pd
 import datetime
@@ -14,13 +13,19 @@ import numpy as np
 import pickle
 import os
 import random
+from core import window
+from core import dataset
+from core import build
+from core import tickcache
+from core.label import PriceLabeler
 
 """
 previously,  I gave secs as 120. but like iljoo said, it needs to be 120.
 in other agents, it can changes but you don't have to read every time seconds periods changes
 just read maximum periods of data and reuse it   
 """
-def prepare_datasets(is_spare_dataset=False, interval=120, len_observation=60, len_sequence_secs=120, save_dir=''):
+def prepare_datasets(is_spare_dataset=False, interval=120, len_observation=60, len_sequence_secs=120, save_dir='',
+                     max_workers=None, incremental=False, quantized=None, max_secs=120, load_csv_dir='0'):
     """
     main coordinate fucntion to create pickle
     :param is_spare_dataset: if true, it uses not prepare_dataset function, but prepares_spare_dataset function.
@@ -28,18 +33,30 @@ def prepare_datasets(is_spare_dataset=False, interval=120, len_observation=60, l
     :param len_observation: only used if is_spare_dataset is true
     :param len_sequence_secs: same as prepare_sparse_dataset
     :param save_dir: root directory where pickle will save
+    :param max_workers: number of processes preparing episodes, default None : one per core
+    :param incremental: only used if is_spare_dataset is true, skip ticker-days which are up to date
+    :param quantized: only used if is_spare_dataset is true, dict of column name -> np.uint8 or np.uint16
+                      for the quantized columns, see core.dataset
+    :param max_secs: only used if is_spare_dataset is true, same as prepare_sparse_dataset
+    :param load_csv_dir: a directory where csv files to be read exist
     :return:
     """
     # l = ioutil.load_data_from_directory('0', max_n_episode=1) # episode type
-    l = ioutil.load_data_from_directory('0')  # episode type
-    for li in l:
-        if is_spare_dataset:
-            prepare_sparse_dataset(li, 120, 120, 60, save_dir)
-        else:
-            prepare_dataset(li, 1, len_sequence_secs)
-
-
-def prepare_sparse_dataset(d, interval=120, len_sequence_of_secs=120, len_observation=60, save_dir=''):
+    if is_spare_dataset:
+        # csv files are parsed once for the agents reading the same directory, see core.tickcache
+        l = tickcache.load_episodes(load_csv_dir, ioutil.load_data_from_directory, max_workers=max_workers)  # episode type
+        build.run_episodes(prepare_sparse_dataset, l, max_workers=max_workers, incremental=incremental,
+                           interval=120, len_sequence_of_secs=120, len_observation=60, save_dir=save_dir,
+                           quantized=quantized, max_secs=max_secs)
+    else:
+        # prepare_dataset selects the rows of the DataFrames with .loc, the csv files are parsed here
+        l = ioutil.load_data_from_directory(load_csv_dir)  # episode type
+        build.run_episodes(prepare_dataset, l, max_workers=max_workers,
+                           interval=1, len_sequence_of_secs=len_sequence_secs)
+
+
+def prepare_sparse_dataset(d, interval=120, len_sequence_of_secs=120, len_observation=60, save_dir='', quantized=None,
+                           max_secs=120):
     """
     original version
     loading data from ticker 20180403, yyyymmdd 003350 is started.
@@ -49,8 +66,10 @@ def prepare_sparse_dataset(d, interval=120, len_sequence_of_secs=120, len_observ
     :param interval: same as prepare_dataset, 120 seconds. it is also for performance
     :param len_sequence_of_secs:  same as prepare_dataset.
     :param len_observation: Instead of 120 seconds, taking 60 seconds is just for performance
-    :param save_dir: root directory where pickle will save
-    :return: same as prepare_dataset
+    :param save_dir: root directory of the dataset, see core.dataset
+    :param quantized: dict of column name -> np.uint8 or np.uint16 for the columns stored quantized, see core.dataset
+    :param max_secs: left time sent by BOA is drawn in [1, max_secs] seconds
+    :return: nothing, it saves the ticker-day with core.dataset
     """
     current_date = d['meta']['date']
     current_ticker = d['meta']['ticker']
@@ -60,65 +79,38 @@ def prepare_sparse_dataset(d, interval=120, len_sequence_of_secs=120, len_observ
     c_end = datetime.datetime(int(current_date[0:4]), int(current_date[4:6]),
                               int(current_date[6:8]), 15, 20)  # 15hr 20min 0sec, finish time
     c_rng_ts = pd.date_range(start=c_start, end=c_end,
-                                    freq=str(interval)+'S')  # range between c_start and c_end saving each seconds' data
-
-    max_idx = len(c_rng_ts) - 1
-
-    x_2d = []  # orderbook
-    x_1d = []  # transactions
-    y_1d = []  # width
-
-    # 경과시간
-    elapsed_time = []
-    # 남은시간
-    left_time = []
-
-    for i, s in enumerate(c_rng_ts):
-        # BOA 에서 보내주는 남은 시간 랜덤 생성.
-        left_secs = random.randint(1, max_secs)
-
-        # SSA 에서 시그널 발생 하는데 까지 걸린 시간을 랜덤 생성.
-        elapsed_secs = random.randint(0, left_secs)
-
-        d_x2d = deque(maxlen=len_observation)
-        d_x1d = deque(maxlen=len_observation)
-
-        if c_rng_ts[max_idx] < s + pd.Timedelta(seconds=len_sequence_of_secs) or i >= max_idx:
-        # if c_rng_ts[max_idx] < s + len_sequence_of_secs or i >= max_idx:
-            break
-        elif s - pd.Timedelta(seconds=len_observation) < c_rng_ts[0]:
-        # elif s - len_observation < c_rng_ts[0]:
-            continue
-        else:
-            width = 0
-            threshold = 0.33
-
-            # assemble observation for len_observation
-            for i in reversed(range(len_observation)):
-                d_x2d.append(d['order'].loc[s-pd.Timedelta(seconds=i)])
-                d_x1d.append(d['quote'].loc[s-pd.Timedelta(seconds=i)])
-                # d_x2d.append(d['order'].loc[s-i])
-                # d_x1d.append(d['quote'].loc[s-i])
-
-            # price_at_signal is the price when the current stock received signal
-            price_at_signal = d['quote'].loc[c_rng_ts[i-elapsed_secs]]['Price(last excuted)']
-            price = d['quote'].loc[c_rng_ts[i]]['Price(last excuted)']
-            gap = price_at_signal - price - threshold
-            width += gap
-
-            x_2d.append(np.array(d_x2d))
-            x_1d.append(np.array(d_x1d))
-            left_time.append(left_secs)
-            elapsed_time.append(elapsed_secs)
-            y_1d.append(width)
-
-    pickle_name = save_dir + os.path.sep + current_date + '_' + current_ticker + '.pickle'
-    f = open(pickle_name, 'wb')
-    pickle.dump([x_2d, x_1d, elapsed_time, left_time, y_1d], f)
-    f.close()
+                                    freq='S')  # range between c_start and c_end saving each seconds' data
+
+    order, quote, present = window.episode_to_arrays(d, c_rng_ts)
+    price = quote[:, window.column_position(d, 'quote', 'Price(last excuted)')]
+    threshold = 0.33
+
+    # a sample every interval seconds
+    signals = window.signal_indices(len(c_rng_ts), interval, len_observation, len_sequence_of_secs)
+
+    # 남은시간 : BOA 에서 보내주는 남은 시간 랜덤 생성.
+    left_time = np.array([random.randint(1, max_secs) for _ in signals], dtype=np.int64)
+    # 경과시간 : SSA 에서 시그널 발생 하는데 까지 걸린 시간을 랜덤 생성.
+    elapsed_time = np.array([random.randint(0, left_secs) for left_secs in left_time], dtype=np.int64)
 
+    keep = (signals >= elapsed_time) & window.complete_windows(present, signals, len_observation) & \
+           present[np.maximum(signals - elapsed_time, 0)]
+    signals, left_time, elapsed_time = signals[keep], left_time[keep], elapsed_time[keep]
 
-def prepare_dataset(d, interval=1, len_sequence_of_secs=120):
+    x_2d = window.extract_windows(order, signals, len_observation)  # orderbook
+    x_1d = window.extract_windows(quote, signals, len_observation)  # transactions
+    # price_at_signal is the price when the current stock received signal, elapsed_time seconds before
+    y_1d = PriceLabeler(price).gap(signals - elapsed_time, elapsed_time, threshold, sign=-1)  # width
+
+    dataset.write_dataset(save_dir, current_date, current_ticker,
+                          {'order': x_2d, 'quote': x_1d, 'elapsed_time': elapsed_time,
+                           'left_time': left_time, 'y': y_1d},
+                          params={'interval': interval, 'len_sequence_of_secs': len_sequence_of_secs,
+                                  'len_observation': len_observation, 'threshold': threshold, 'max_secs': max_secs},
+                          quantized=quantized)
+
+
+def prepare_dataset(d, interval=1, len_sequence_of_secs=120, threshold=0.33):
     """
     :param d
         the variable having pickle file data in memory
@@ -127,65 +119,33 @@ def prepare_dataset(d, interval=1, len_sequence_of_secs=120):
         if it bring data moving 1 second forward, data size is so huge.
     :param len_sequence_of_secs:
         each observation length
+    :param threshold:
+        subtracted from the gap of each second when the width is calculated
     :return:
         nothing, it end up saving list of pickle files as you configured
     """
     current_date = d['meta']['date']
     current_ticker = d['meta']['ticker']
 
-    d_price = deque(maxlen=len_sequence_of_secs)
-
     c_start = datetime.datetime(int(current_date[0:4]), int(current_date[4:6]),
                                 int(current_date[6:8]), 9, 5)  # 9hr 5min 0sec, start time
     c_end = datetime.datetime(int(current_date[0:4]), int(current_date[4:6]),
                               int(current_date[6:8]), 15, 20)  # 15hr 20min 0sec, finish time
     c_rng_ts = pd.date_range(start=c_start, end=c_end,
-                                    freq=str(interval)+'S')  # range between c_start and c_end saving each seconds' data
-
-    x_2d = []  # orderbook
-    x_1d = []  # transactions
-    y_1d = []  # width
-
-    # 경과시간
-    elapsed_time = []
-    # 남은시간
-    left_time = []
-
-    max_idx = len(c_rng_ts) - 1
-
-    for i, s in enumerate(c_rng_ts):
-        # BOA 에서 보내주는 남은 시간 랜덤 생성.
-        left_secs = random.randint(1, max_secs)
-        # BSA 에서 시그널을 보낸 후 경과한 시간.
-        bsa_elapsed_secs = max_secs - left_secs
-        # SSA 에서 시그널 발생 하는데 까지 걸린 시간을 랜덤 생성.
-        elapsed_secs = random.randint(0, left_secs)
-
-        if c_rng_ts[max_idx] < c_rng_ts[i] + len_sequence_of_secs or i >= max_idx:
-            break
-        elif s - len_sequence_of_secs < c_rng_ts[0]:
-            continue
-        else:
-            first_quote = d['quote'].loc[s]
-            first_order = d['order'].loc[s]
-            width = 0
-            threshold = 0.33
-
-            # calculate width
-            for j in range(len_sequence_of_secs):
-                if j == 0:
-                    # price_at_signal is the price when the current stock received signal
-                    price_at_signal = d['quote'].loc[c_rng_ts[i+j]]['Price(last excuted)']
-                else:
-                    price = d['quote'].loc[c_rng_ts[i+j]]['Price(last excuted)']
-                    gap = price_at_signal - price - threshold
-                    width += gap
-
-            left_time.append(left_secs)
-            elapsed_time.append(elapsed_secs)
-            x_2d.append(first_order)
-            x_1d.append(first_quote)
-            y_1d.append(width)
+                                    freq='S')  # range between c_start and c_end saving each seconds' data
+
+    _, quote, present = window.episode_to_arrays(d, c_rng_ts)
+    price = quote[:, window.column_position(d, 'quote', 'Price(last excuted)')]
+
+    signals = window.signal_indices(len(c_rng_ts), interval, len_sequence_of_secs, len_sequence_of_secs)
+    labeler = PriceLabeler(price)
+    signals = signals[window.complete_windows(present, signals + len_sequence_of_secs - 1, len_sequence_of_secs) &
+                      labeler.complete(signals, len_sequence_of_secs)]
+
+    x_2d = [row for _, row in d['order'].loc[c_rng_ts[signals]].iterrows()]  # orderbook
+    x_1d = [row for _, row in d['quote'].loc[c_rng_ts[signals]].iterrows()]  # transactions
+    # price_at_signal is the price when the current stock received signal
+    y_1d = labeler.width(signals, len_sequence_of_secs, threshold, sign=-1)  # width
 
     pickle_name = current_date + '_' + current_ticker + '.pickle'
     f = open(pickle_name, 'wb')
@@ -195,7 +155,10 @@ def prepare_dataset(d, interval=1, len_sequence_of_secs=120):
 
 save_dir = 'sparse'
 max_secs = 120
+# 소스 데이터와 파라미터가 같은 ticker-day 는 다시 만들지 않음
+incremental = False
 if not os.path.isdir(save_dir):
     os.makedirs(save_dir)
 
-prepare_datasets(is_spare_dataset=True, save_dir=save_dir)
\ No newline at end of file
+if __name__ == '__main__':
+    prepare_datasets(is_spare_dataset=True, save_dir=save_dir, incremental=incremental, max_secs=max_secs)
\ No newline at end of file
@@ -9,6 +9,10 @@ from keras.layers import LeakyReLU, Input, Dense, Conv3D, Conv1D, Dense, Flatten
 
 
 from gym_core.ioutil import *  # file i/o to load stock csv files
+from core import dataset
+from core import util
+from core import tensor
+from core import window
 
 
 """
@@ -128,62 +132,19 @@ def get_real_data_sparsed(ticker='001470', date='20180420', train_data_rows=None
     current_ticker = ticker
     current_date = date
 
-    x1_dimension_info = (10, 2, 60, 2)  # 60 --> 120 (@iljoo)
-    x2_dimension_info = (60, 11)
-    x3_dimension_info = (max_len,)
-    x4_dimension_info = (max_len,)
-    # y1_dimension_info = (120,)
-
-    pickle_name = save_dir + os.path.sep + current_ticker + '_' + current_date + '.pickle'
-    f = open(pickle_name, 'rb')
-    d = pickle.load(f)  # d[data_type][second] : mapobject!!
-    f.close()
-
-    total_rows = len(d[0])
+    d = dataset.read_dataset(save_dir, current_date, current_ticker)  # d[column][row] : memory-mapped column
 
     if train_data_rows is None:
-        train_data_rows = len(d[0])
-
-    x1 = np.zeros([10, 2, 60, 2])
-    x2 = np.zeros([60, 11])
-    x3 = np.zeros([max_len,])
-    x4 = np.zeros([max_len,])
-    y1 = np.zeros([120])
-
-    d_x1 = []
-    d_x2 = []
-    d_x3 = []
-    d_x4 = []
-    d_y1 = []
-
-    for idx in range(train_data_rows):
-        for row in range(x1_dimension_info[0]):  # 10 : row
-            for column in range(x1_dimension_info[1]):  # 2 : column
-                for second in range(x1_dimension_info[2]):  # 60: seconds
-                    for channel in range(x1_dimension_info[3]):  # 2 : channel
-                        x1[row][column][second][channel] = d[0][idx][second][channel*20+column*10]
-        d_x1.append(x1)
-
-        for second in range(x2_dimension_info[0]):  # 120 : seconds
-            for feature in range(x2_dimension_info[1]):  # 11 : features
-                x2[second, feature] = d[1][idx][second][feature]
-        d_x2.append(x2)
-
-        binary_second = seconds_to_binary_array(d[2][idx], max_len)
-        for feature in range(x3_dimension_info[0]):  # max_len :features
-            x3[feature] = binary_second[feature]
-        d_x3.append(x3)
-
-        binary_second = seconds_to_binary_array(d[3][idx], max_len)
-        for feature in range(x4_dimension_info[0]):  # max_len :features
-            x4[feature] = binary_second[feature]
-        d_x4.append(x4)
+        train_data_rows = len(d['order'])
 
+    # x1 : (rows, 10, 2, seconds, 2), x2 : (rows, seconds, 11)
+    x1 = tensor.orderbook_tensor(d['order'][:train_data_rows])
+    x2 = tensor.transaction_tensor(d['quote'][:train_data_rows])
+    x3 = encode_time(d['elapsed_time'][:train_data_rows])
+    x4 = encode_time(d['left_time'][:train_data_rows])
+    y1 = np.asarray(d['y'][:train_data_rows])
 
-        # for second in range(y1_dimension_info[0]): # 60 : seconds
-        d_y1.append(d[4][idx])
-
-    return np.asarray(d_x1), np.asarray(d_x2), np.asarray(d_x3), np.asarray(d_x4), np.asarray(d_y1)
+    return x1, x2, x3, x4, y1
 
 
 def get_real_data(ticker='001470', date='20180420', train_data_rows=None, save_dir=''):
@@ -198,59 +159,29 @@ def get_real_data(ticker='001470', date='20180420', train_data_rows=None, save_d
     current_ticker = ticker
     current_date = date
 
-    x1_dimension_info = (10, 2, 120, 2)  # 60 --> 120 (@iljoo)
-    x2_dimension_info = (120, 11)
-    # y1_dimension_info = (120,)
-
     pickle_name = save_dir + os.path.sep + current_ticker + '_' + current_date + '.pickle'
     f = open(pickle_name, 'rb')
     d = pickle.load(f)  # d[data_type][second] : mapobject!!
     f.close()
 
-    total_rows = len(d[0])
-
     if train_data_rows is None:
         train_data_rows = len(d[0])
 
-    x1 = np.zeros([10, 2, 120, 2])
-    x2 = np.zeros([120, 11])
-    y1 = np.zeros([120])
-
-    d_x1 = []
-    d_x2 = []
-    d_y1 = []
-
-    for idx_second in range(train_data_rows):
-
-        if idx_second + 120 > total_rows:
-            break
+    # one row per second, sample idx_second covers the 120 seconds starting at idx_second
+    rows = max(0, min(train_data_rows, len(d[0]) - 120 + 1))
+    if rows == 0:
+        # fewer than 120 seconds, no sample
+        x1 = tensor.orderbook_tensor(np.zeros((0, 120, len(tensor.ORDERBOOK_COLUMNS)), dtype=np.float32))
+        x2 = tensor.transaction_tensor(np.zeros((0, 120, tensor.FEATURES), dtype=np.float32))
+        return x1, x2, np.zeros(0, dtype=np.float32)
+    order = np.array([[r[name] for name in tensor.ORDERBOOK_COLUMNS] for r in d[0][:rows + 119]], dtype=np.float32)
+    quote = np.array([np.asarray(r)[:tensor.FEATURES] for r in d[1][:rows + 119]], dtype=np.float32)
 
-        for row in range(x1_dimension_info[0]):  # 10 : row
-            for column in range(x1_dimension_info[1]):  # 2 : column
-                for second in range(x1_dimension_info[2]):  # 120 : seconds
-                    for channel in range(x1_dimension_info[3]):  # 2 : channel
-                        key = ''
-                        if channel == 1:
-                            key = 'Buy'
-                        else:
-                            key = 'Sell'
-                        if column == 0:
-                            value = 'Hoga'
-                        else:
-                            value = 'Order'
+    x1 = tensor.orderbook_tensor(window.rolling_windows(order, 120))
+    x2 = tensor.transaction_tensor(window.rolling_windows(quote, 120))
+    y1 = np.asarray(d[2][:rows], dtype=np.float32)
 
-                        x1[row][column][second][channel] = d[0][idx_second+second][key+value+str(row+1)]
-        d_x1.append(x1)
-
-        for second in range(x2_dimension_info[0]):  # 120 : seconds
-            for feature in range(x2_dimension_info[1]):  # 11 : features
-                x2[second, feature] = d[1][idx_second+second][feature]
-        d_x2.append(x2)
-
-        # for second in range(y1_dimension_info[0]): # 60 : seconds
-        d_y1.append(d[2][idx_second])
-
-    return np.asarray(d_x1), np.asarray(d_x2), np.asarray(d_y1)
+    return x1, x2, y1
 
 
 def load_data(t, d, save_dir =''):
@@ -267,20 +198,12 @@ def load_data_sparsed(t, d, save_dir =''):
     return x1, x2, x3, x4, y
 
 
-dat = np.arange(1, 13) / 2.0
-def discretize(data, bins):
-    split = np.array_split(np.sort(data), bins)
-    cutoffs = [x[-1] for x in split]
-    cutoffs = cutoffs[:-1]
-    discrete = np.digitize(data, cutoffs, right=True)
-    return discrete, cutoffs
-def get_maxlen_of_binary_array(max_seconds):
-    return len(np.binary_repr(max_seconds))
-def seconds_to_binary_array(seconds, max_len):
-    return np.binary_repr(seconds).zfill(max_len)
-
 # train_using_real_data(d, 'sparse')
-max_len = get_maxlen_of_binary_array(120)
+d  = os.path.abspath(os.path.dirname(__file__)) + "/sparse/eval"
+# left/elapsed time of the dataset is at most max_secs seconds
+max_secs = dataset.max_param(d, 'max_secs', 120)
+max_len = util.get_maxlen_of_binary_array(max_secs)
+encode_time = util.TimeEncoder(max_secs, max_len=max_len)
 
 model = build_network_for_sparsed()
 model.compile(optimizer='adam', loss='mse', metrics=['mae','mape','accuracy'])
@@ -289,9 +212,8 @@ model.load_weights('final_weight.h5f')
 
 # model = Model('final_model.h5')
 
-d  = os.path.abspath(os.path.dirname(__file__)) + "/sparse/eval"
-l = load_ticker_yyyymmdd_list_from_directory(d)
-for (ti, da) in l:
+l = dataset.list_datasets(d)
+for (da, ti) in l:
     x1, x2, x3, x4, y = get_real_data_sparsed(ti, da, save_dir=d)
     scores = model.evaluate({'x1': x1, 'x2': x2, 'x3': x3, 'x4': x4}, y, verbose=0)
     print("%s: %.2f    %s: %.2f    %s: %.2f" % (model.metrics_names[1], scores[1], model.metrics_names[2], scores[2], model.metrics_names[3], scores[3]))